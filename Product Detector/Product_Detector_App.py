@@ -1,4 +1,4 @@
-﻿from flask import Flask, render_template, request, redirect, url_for, session, flash
+﻿from flask import Flask, render_template, request, redirect, url_for, session, flash, g
 from flask_session import Session
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -8,17 +8,31 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+import functools
 import os
 import time
 import re
 import uuid
-from bs4 import BeautifulSoup
-import mysql.connector
 import secrets
-from mysql.connector import Error
 from datetime import timedelta
 from werkzeug.utils import secure_filename
 
+from Product_Detector_Browser import fetch_rendered_page, get_browser_pool
+from Product_Detector_Cache import PageCache
+from Product_Detector_DB import get_database
+from Product_Detector_Fetcher import TieredFetcher
+from Product_Detector_Jobs import DONE, FAILED, JobQueue, QueueFullError
+from Product_Detector_Heuristics import CURRENCY_SYMBOLS, CURRENCY_CODES, find_minimal_product_containers
+from Product_Detector_Metrics import (FETCH_SECONDS, FETCHES, JOBS, LABELS_SAVED, PAGE_BYTES, PRODUCTS_PER_PAGE,
+                                      REQUEST_SECONDS, STAGE_SECONDS, Gauge, render_metrics)
+from Product_Detector_Models import ModelLoadError, get_registry
+from Product_Detector_Parser import DEFAULT_BACKEND, make_soup
+from Product_Detector_Predict import Predictor
+from Product_Detector_Profiling import SORT_KEYS, list_profiles, profile_report, profiled, should_profile
+from Product_Detector_Readiness import log_report, readiness_for
+from Product_Detector_Store import FetchIndex, get_pack, read_product
+from Product_Detector_Streaming import iter_file_chunks, stream_product_containers
+
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
 
@@ -33,34 +47,84 @@ app.config.update(
     SESSION_TYPE='filesystem',
     SESSION_FILE_DIR='./flask_session',
     DATA_DIR = './data',
+    HTML_PARSER=DEFAULT_BACKEND,
+    STREAMING_DETECTION=False,
+    BROWSER_POOL_SIZE=2,
+    BROWSER_MAX_USES=50,
+    BROWSER_HEADLESS=False,
+    READINESS_LOG='./data/readiness_log.csv',
+    FETCH_MIN_PRODUCTS=3,
+    FETCH_TIERS='./data/fetch_tiers.json',
+    PAGE_CACHE_DIR='./data/page_cache',
+    PAGE_CACHE_TTL=6 * 60 * 60,
+    PAGE_CACHE_MAX_BYTES=256 * 1024 * 1024,
+    PRODUCT_PACK='./data/products.pack',
+    JOB_WORKERS=2,
+    JOB_MAX_PENDING=20,
+    JOB_RETENTION=60 * 60,
+    PRODUCTS_PER_PAGE=24,
+    FETCH_INDEX='./data/fetch_index.sqlite3',
+    FETCH_INDEX_RETENTION=24 * 60 * 60,
+    SESSION_CLEANUP_INTERVAL=10 * 60,
+    PREDICT_MODEL='random_forest',
+    PREDICT_WARM=True,
+    PROFILE_DIR='./data/profiles',
+    PROFILE_SAMPLE_RATE=0.0,
+    PROFILE_TOKEN=os.environ.get('PRODUCT_DETECTOR_PROFILE_TOKEN'),
     MAX_CONTENT_LENGTH=16 * 1024 * 1024
 )
 
 Session(app)
 
-db_config = {
-    'host': '127.0.0.1',
-    'user': 'root',
-    'password': 'anan123',
-    'database': 'product_detecting',
-    'autocommit': False,
-}
+# The streaming detector always parses with lxml, and lxml serializes some
+# containers differently from html.parser (see Product_Detector_Parity.py),
+# so streaming is only allowed when the rest of the app uses lxml too
+if app.config['STREAMING_DETECTION'] and app.config['HTML_PARSER'] != 'lxml':
+    raise RuntimeError("STREAMING_DETECTION requires HTML_PARSER='lxml'")
+
+browser_pool = get_browser_pool(size=app.config['BROWSER_POOL_SIZE'],
+                                max_uses=app.config['BROWSER_MAX_USES'],
+                                headless=app.config['BROWSER_HEADLESS'])
 
 os.makedirs(app.config['DATA_DIR'], exist_ok=True)
 os.makedirs(os.path.join(app.config['DATA_DIR'], 'pages'), exist_ok=True)
 os.makedirs(os.path.join(app.config['DATA_DIR'], 'products'), exist_ok=True)
 
-CURRENCY_SYMBOLS = {"$", "€", "£", "¥", "₺"}
-CURRENCY_CODES = {"USD", "EUR", "GBP", "JPY", "TRY", "TL"}
-
-def create_db_connection():
+def init_database():
+    # Opens the connection pool and creates train_data once at startup
     try:
-        connection = mysql.connector.connect(**db_config)
-        print("Database connection established")
-        return connection
-    except Error as e:
+        get_database().ensure_schema()
+        return True
+    except Exception as e:
         print(f"Database connection failed: {e}")
-        return None
+        return False
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    return response
+
+last_cleanup = 0.0
+
+@app.before_request
+def cleanup_expired():
+    # The filesystem session backend only drops expired sessions once it is
+    # over its file threshold, so expire them here through its cachelib
+    # cache (which skips its own count file and keeps the count right), and
+    # drop old fetches from the index
+    global last_cleanup
+    now = time.time()
+    if now - last_cleanup < app.config['SESSION_CLEANUP_INTERVAL']:
+        return
+    last_cleanup = now
+    app.session_interface.cache._remove_expired(now)
+    fetch_index.expire(app.config['FETCH_INDEX_RETENTION'])
 
 def save_to_file(content, directory, filename):
     path = os.path.join(app.config['DATA_DIR'], directory, filename)
@@ -90,200 +154,289 @@ def contains_price_canceled(text):
                     return True
     return False
 
-def contains_price(text):
-    text = text.strip()
-    price_pattern = r"""
-        (?:  
-            (?:€|\$|₺|£|¥|TL)\s?[\d]+(?:[.,]\d+)?  
-            |  
-            [\d]+(?:[.,]\d+)?\s?(?:€|\$|₺|£|¥|TL)  
-            |  
-            [\d]+(?:[.,]\d+)(?:\s?[^\w\s])?  
-        )
-    """
-    if re.search(price_pattern, text, re.VERBOSE | re.IGNORECASE):
-        return True
-    words = text.split()
-    for i, word in enumerate(words):
-        if word.replace(",", "").replace(".", "").isdigit():
-            if i + 1 < len(words) and words[i + 1] in ['€', '$', '₺', '£', '¥', 'TL']:
-                return True
-    return False
-
-def contains_unit(text):
-    return bool(re.search(r"\b\d+(\.\d+)?\s?(g|kg|ml|l|pcs|unit|x)?\b", text, re.IGNORECASE))
-
-def contains_image(element):
-    return element.find("img") is not None
-
-def is_valid_product(element):
-    text_content = element.get_text().lower()
-    has_price = contains_price(text_content)
-    has_unit = contains_unit(text_content)
-    has_image = contains_image(element)
-    return has_price and has_unit and has_image
-
-def find_minimal_product_containers(soup):
-    product_candidates = [el for el in soup.find_all(True) if is_valid_product(el)]
-    minimal_products = []
-    for candidate in product_candidates:
-        if not any(is_valid_product(child) for child in candidate.find_all(True, recursive=False)):
-            minimal_products.append(candidate)
-    return minimal_products
-
 def fetch_page_with_js_a101(url):
-    chrome_options = Options()
-    #chrome_options.add_argument("--headless")  # run in headless mode
-    service = Service("chromedriver.exe")
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    driver.get(url)
-    
-    time.sleep(10)
-    
-    html = driver.page_source
-    driver.quit()
+    html, report = fetch_rendered_page(url, browser_pool, readiness_for(url, scroll=False))
+    log_report(report, app.config['READINESS_LOG'])
     return html
 
 def fetch_page_with_js(url):
-    chrome_options = Options()
-    # chrome_options.add_argument("--headless")  # Optional: run in headless mode
-    service = Service("chromedriver.exe")
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    
-    driver.get(url)
-    time.sleep(5)  # Allow page to load initially
-
-    # Slowly scroll down the page
-    scroll_pause_time = 2  # Adjust the pause time (in seconds) between scrolls
-    last_position = driver.execute_script("return window.pageYOffset;")
-
-    while True:
-        # Scroll down by a small amount
-        driver.execute_script("window.scrollBy(0, 300);")
-        time.sleep(scroll_pause_time)
-
-        scroll_pause_time+=1
-
-        # Get the current scroll position
-        new_position = driver.execute_script("return window.pageYOffset;")
-        
-        # Check if we are at the bottom or no more scrollable content
-        if new_position == last_position or scroll_pause_time==10:
-            break
-        last_position = new_position
-
-    # Get the fully loaded HTML
-    html = driver.page_source
-    driver.quit()
+    # Wait for the DOM and network to settle, then scroll until no new
+    # products show up
+    html, report = fetch_rendered_page(url, browser_pool)
+    log_report(report, app.config['READINESS_LOG'])
     return html
 
+# Plain HTTP first, Chrome only when the server-rendered page has too few products
+fetcher = TieredFetcher(fetch_page_with_js,
+                        min_products=app.config['FETCH_MIN_PRODUCTS'],
+                        parser=app.config['HTML_PARSER'],
+                        tiers_path=app.config['FETCH_TIERS'])
+
+# Fetching and detection run in the background so requests return at once
+jobs = JobQueue(workers=app.config['JOB_WORKERS'],
+                max_pending=app.config['JOB_MAX_PENDING'],
+                retention_s=app.config['JOB_RETENTION'])
+
+# Per-fetch product metadata lives here, the session only holds session_id
+fetch_index = FetchIndex(app.config['FETCH_INDEX'])
+
+# Models load lazily; PREDICT_WARM loads the /predict model at startup so
+# the first request has no cold start
+predictor = Predictor(app.config['PREDICT_MODEL'])
+if app.config['PREDICT_WARM']:
+    try:
+        print(f"Loaded {predictor.model_name} model in {predictor.warm():.2f}s")
+    except ModelLoadError as e:
+        print(f"Could not load the {predictor.model_name} model: {e}")
+
+# Labeling often revisits the same category page, so fetched pages are cached
+page_cache = PageCache(app.config['PAGE_CACHE_DIR'],
+                       ttl_s=app.config['PAGE_CACHE_TTL'],
+                       max_bytes=app.config['PAGE_CACHE_MAX_BYTES'])
+
+def fetch_page(url):
+    # Returns the page HTML and, when they are already known, its products
+    start = time.perf_counter()
+    html_content = page_cache.get(url)
+    if html_content is not None:
+        tier, products = 'cache', None
+    else:
+        fetched = fetcher.fetch(url)
+        page_cache.put(url, fetched.html)
+        html_content, tier, products = fetched.html, fetched.tier, fetched.products
+        # The HTTP tier parses and detects to decide whether the page is usable
+        for stage, seconds in fetched.timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+    FETCH_SECONDS.observe(time.perf_counter() - start, tier=tier)
+    FETCHES.inc(tier=tier)
+    PAGE_BYTES.observe(len(html_content))
+    return html_content, products
+
+def detect_products(html_content, page_path):
+    # Yields the markup of every minimal product container on the page. The
+    # streaming mode reads the saved page in chunks and never builds the
+    # whole tree, which keeps memory low on huge infinite-scroll pages.
+    if app.config['STREAMING_DETECTION']:
+        # Parsing and detection are one pass here, timed together as 'detect'
+        with STAGE_SECONDS.time(stage='detect'):
+            for product in stream_product_containers(iter_file_chunks(page_path)):
+                yield product.html
+    else:
+        with STAGE_SECONDS.time(stage='parse'):
+            soup = make_soup(html_content, app.config['HTML_PARSER'])
+        with STAGE_SECONDS.time(stage='detect'):
+            products = find_minimal_product_containers(soup)
+        for product in products:
+            yield str(product)
+
+def profile_requested():
+    # Admins ask for a profile with an X-Profile header or ?profile=, set to PROFILE_TOKEN
+    token = app.config['PROFILE_TOKEN']
+    return bool(token) and token in (request.headers.get('X-Profile'), request.args.get('profile'))
+
+def want_profile():
+    return should_profile(profile_requested(), app.config['PROFILE_SAMPLE_RATE'])
+
+def profile_route(name):
+    # Runs the view under cProfile when want_profile() says so; the view can
+    # add details to g.profile_meta
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with profiled(name, want_profile(), app.config['PROFILE_DIR'],
+                          method=request.method, path=request.path) as meta:
+                g.profile_meta = meta
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_fetch_job(session_id, url, profile=False):
+    # Runs on a job worker: no request context, so no session or flash here
+    try:
+        with STAGE_SECONDS.time(stage='job'), \
+                profiled('fetch_job', profile, app.config['PROFILE_DIR'], url=url) as meta:
+            result = fetch_and_store(session_id, url)
+            meta.update(page_bytes=result['page_bytes'], products=result['products_count'])
+    except Exception:
+        JOBS.inc(outcome='failed')
+        raise
+    JOBS.inc(outcome='done')
+    return result
+
+def fetch_and_store(session_id, url):
+    html_content, detected = fetch_page(url)
+    page_bytes = len(html_content)
+
+    # Save page content to file
+    with STAGE_SECONDS.time(stage='save_page'):
+        page_filename = f"{session_id}_page.html"
+        page_path = save_to_file(html_content, 'pages', page_filename)
+
+    if detected is None:
+        if app.config['STREAMING_DETECTION']:
+            # The streaming detector reads the saved page, so the string is
+            # not kept alive for the whole detection pass
+            html_content = None
+        detected = detect_products(html_content, page_path)
+    del html_content
+
+    # Products go to the pack as they are yielded; in streaming mode
+    # 'save_products' therefore includes the 'detect' time
+    with STAGE_SECONDS.time(stage='save_products'):
+        product_paths = get_pack(app.config['PRODUCT_PACK']).append(
+            (f"{session_id}_product_{i}.html", product) for i, product in enumerate(detected))
+        fetch_index.put(session_id, url, page_path, product_paths)
+    PRODUCTS_PER_PAGE.observe(len(product_paths))
+
+    return {'session_id': session_id, 'url': url, 'products_count': len(product_paths),
+            'page_bytes': page_bytes}
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
         url = request.form["url"]
+
+        # Generate unique IDs for this session
+        session_id = str(uuid.uuid4())
+        session.clear()
+        session.permanent = True
+        session['session_id'] = session_id
+
         try:
-            html_content = fetch_page_with_js(url)
-            products = find_minimal_product_containers(BeautifulSoup(html_content, "html.parser"))
-            
-            # Generate unique IDs for this session
-            session_id = str(uuid.uuid4())
-            session.clear()
-            session.permanent = True
-            session['session_id'] = session_id
-            session['url'] = url
-            session['products_count'] = len(products)
-            
-            # Save page content to file
-            page_filename = f"{session_id}_page.html"
-            page_path = save_to_file(html_content, 'pages', page_filename)
-            session['page_path'] = page_path
-            
-            # Save products to files and store paths
-            product_paths = []
-            for i, product in enumerate(products):
-                product_filename = f"{session_id}_product_{i}.html"
-                product_path = save_to_file(str(product), 'products', product_filename)
-                product_paths.append(product_path)
-            
-            session['product_paths'] = product_paths
-            flash("Products fetched successfully!", "success")
+            job = jobs.submit(run_fetch_job, session_id, url, want_profile(), owner=session_id)
+        except QueueFullError:
+            flash("Too many fetches are running, please try again shortly.", "error")
+            return render_template("index.html", url=url), 503
 
-            return render_template("index.html", 
-                                products=[str(p) for p in products],
-                                url=url)
-            
+        if request.accept_mimetypes.best == 'application/json':
+            return {'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}, 202
+        return render_template("index.html", url=url, job_id=job.id)
+
+    return render_template("index.html", url="")
+
+def session_job(job_id):
+    # Jobs are only visible to the session that submitted them
+    job = jobs.get(job_id)
+    if job is None or job.owner != session.get('session_id'):
+        return None
+    return job
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = session_job(job_id)
+    if job is None:
+        return {'error': "Unknown or expired job"}, 404
+    status = job.status()
+    if job.state == DONE:
+        status['result_url'] = url_for('job_result', job_id=job_id)
+    return status
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = session_job(job_id)
+    if job is None:
+        return {'error': "Unknown or expired job"}, 404
+    if job.state == FAILED:
+        return {'error': f"Error fetching products: {job.error}"}, 500
+    if job.state != DONE:
+        return job.status(), 202
+
+    return dict(job.result, products_url=url_for('products_page'))
+
+def current_fetch():
+    session_id = session.get('session_id')
+    return fetch_index.get(session_id) if session_id else None
+
+@app.route("/products")
+def products_page():
+    # One page of the current fetch's product snippets, read from the pack
+    fetch = current_fetch()
+    if fetch is None:
+        return {'error': "No products in this session. Please fetch again."}, 404
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', app.config['PRODUCTS_PER_PAGE'], type=int), 1), 200)
+    total = fetch['products_count']
+    start = (page - 1) * per_page
+    product_paths = fetch_index.product_paths(fetch['session_id'], range(start + 1, min(start + per_page, total) + 1))
+    products = [{'index': index, 'html': read_product(path)} for index, path in sorted(product_paths.items())]
+    return {'page': page, 'per_page': per_page, 'total': total, 'products': products,
+            'next_page': page + 1 if start + per_page < total else None}
+
+@app.route("/predict", methods=["POST"])
+@profile_route('predict')
+def predict():
+    # Model suggestions for the candidate products of a URL or of raw HTML,
+    # sent as form fields or as a JSON body
+    data = request.get_json(silent=True) or request.form
+    html_content = data.get('html')
+    url = data.get('url')
+    if not html_content and not url:
+        return {'error': "Send a url or html"}, 400
+
+    fetch_s = 0.0
+    if not html_content:
+        start = time.perf_counter()
+        try:
+            html_content, _ = fetch_page(url)
         except Exception as e:
-            flash(f"Error fetching products: {str(e)}", "error")
-    
-    return render_template("index.html", products=[], url="")
+            return {'error': f"Error fetching page: {str(e)}"}, 502
+        fetch_s = time.perf_counter() - start
+    g.profile_meta.update(url=url, page_bytes=len(html_content))
+
+    try:
+        with STAGE_SECONDS.time(stage='predict'):
+            products, timings = predictor.predict_html(html_content, app.config['HTML_PARSER'])
+    except ModelLoadError as e:
+        return {'error': f"Model is not available: {str(e)}"}, 503
+    if str(data.get('include_html', '1')).lower() in ('0', 'false'):
+        for product in products:
+            del product['html']
+    return dict(timings, fetch_s=fetch_s, model=predictor.model_name, url=url,
+                candidates=len(products), predicted=sum(p['label'] for p in products), products=products)
+
+def label_response(message, category, status=200, **extra):
+    # JSON for the grid's background submissions, flash and redirect for forms
+    if request.accept_mimetypes.best == 'application/json':
+        return dict(extra, message=message, category=category), status
+    flash(message, category)
+    return redirect(url_for('index'))
 
 @app.route("/save_labels", methods=["POST"])
+@profile_route('save_labels')
 def save_labels():
-    if 'products_count' not in session:
-        flash("Session expired. Please fetch again.", "error")
-        return redirect(url_for('index'))
+    # Accepts any subset of the label_<n> fields, e.g. one grid page at a
+    # time. Labels sent again replace the earlier ones; finished=1 ends the
+    # labeling of this fetch.
+    fetch = current_fetch()
+    if fetch is None or fetch['finished']:
+        return label_response("Session expired. Please fetch again.", "error", 410)
 
     try:
-        required_keys = ['session_id', 'url', 'page_path', 'product_paths']
-        if not all(key in session for key in required_keys):
-            flash("Session data incomplete. Please fetch again.", "error")
-            return redirect(url_for('index'))
+        labels_by_index = {}
+        for key, value in request.form.items():
+            if key.startswith('label_'):
+                labels_by_index[int(key[len('label_'):])] = int(value)
+        refs = fetch_index.product_paths(fetch['session_id'], labels_by_index)
+        product_paths = [refs[index] for index in sorted(refs)]
+        labels = [labels_by_index[index] for index in sorted(refs)]
 
-        labels = [int(request.form.get(f"label_{i+1}", 0)) for i in range(session['products_count'])]
-
-        conn = None
-        cursor = None
         try:
-            conn = create_db_connection()
-            if not conn:
-                raise Exception("Could not connect to database")
-
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS train_data (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    session_id VARCHAR(36) NOT NULL,
-                    url VARCHAR(255) NOT NULL,
-                    page_path TEXT NOT NULL,
-                    product_path TEXT NOT NULL,
-                    label INT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX (session_id)
-                )
-            """)
-            
-            for i, (product_path, label) in enumerate(zip(session['product_paths'], labels)):
-                cursor.execute("""
-                    INSERT INTO train_data 
-                    (session_id, url, page_path, product_path, label) 
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (session['session_id'], session['url'], 
-                     session['page_path'], product_path, label))
-            
-            conn.commit()
-            flash("Labels saved successfully!", "success")
-            print(f"Saved {len(labels)} products to database")
+            with STAGE_SECONDS.time(stage='db_insert'):
+                saved = get_database().insert_labels(fetch['session_id'], fetch['url'], fetch['page_path'],
+                                                      product_paths, labels, replace=True)
+            LABELS_SAVED.inc(saved)
+            print(f"Saved {saved} products to database")
 
         except Exception as e:
-            if conn:
-                conn.rollback()
             print(f"Unexpected error: {e}")
-            flash(f"Error saving labels: {str(e)}", "error")
-            return redirect(url_for('index'))   
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-
-        session.pop('products_count', None)
-        return redirect(url_for('index'))
-    
+            return label_response(f"Error saving labels: {str(e)}", "error", 500)
+
+        if request.form.get('finished'):
+            fetch_index.finish(fetch['session_id'])
+        return label_response("Labels saved successfully!", "success", saved=saved)
+
     except Exception as e:
-        flash(f"Error processing labels: {str(e)}", "error")
-        return redirect(url_for('index'))
+        return label_response(f"Error processing labels: {str(e)}", "error", 400)
 
 @app.route("/session_test")
 def session_test():
@@ -291,12 +444,59 @@ def session_test():
     session.modified = True
     return f"Session test - contains: {list(session.keys())}"
 
+@app.route("/cache_stats")
+def cache_stats():
+    return page_cache.summary()
+
+@app.route("/models")
+def models_status():
+    # Load time and resident size of every model loaded so far
+    return {'models': get_registry().stats()}
+
+def can_view_profiles():
+    # Only with the PROFILE_TOKEN; without one set the pages do not exist.
+    # The remote address is no check, behind a proxy every request is local
+    return profile_requested()
+
+@app.route("/profiles")
+def profiles():
+    if not can_view_profiles():
+        return "Not found", 404
+    return render_template("profiles.html", profiles=list_profiles(app.config['PROFILE_DIR']),
+                           token=request.args.get('profile', ''))
+
+@app.route("/profiles/<profile_id>")
+def profile_detail(profile_id):
+    if not can_view_profiles():
+        return "Not found", 404
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return f"Unknown sort, use one of: {', '.join(SORT_KEYS)}", 400
+    report = profile_report(profile_id, app.config['PROFILE_DIR'], sort=sort)
+    if report is None:
+        return "Not found", 404
+    return report, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+JOBS_BY_STATE = Gauge('product_detector_jobs', "Jobs currently held by state", ['state'])
+PAGE_CACHE = Gauge('product_detector_page_cache', "Page cache counters and size", ['stat'])
+
+@app.route("/metrics")
+def metrics():
+    # Prometheus text format
+    for state, count in jobs.stats().items():
+        JOBS_BY_STATE.set(count, state=state)
+    for stat, value in page_cache.summary().items():
+        if stat != 'codec':
+            PAGE_CACHE.set(value, stat=stat)
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route("/db_test")
 def db_test():
-    conn = create_db_connection()
-    if conn:
-        conn.close()
-        return "Database connection works"
+    try:
+        if get_database().ping():
+            return "Database connection works"
+    except Exception as e:
+        print(f"Database connection failed: {e}")
     return "Database connection failed"
 
 if __name__ == "__main__":
@@ -304,9 +504,7 @@ if __name__ == "__main__":
     os.makedirs(os.path.join(app.config['DATA_DIR'], 'pages'), exist_ok=True)
     os.makedirs(os.path.join(app.config['DATA_DIR'], 'products'), exist_ok=True)
     
-    test_conn = create_db_connection()
-    if test_conn:
-        test_conn.close()
+    if init_database():
         print("Database connection verified")
     else:
         print("Could not verify database connection")
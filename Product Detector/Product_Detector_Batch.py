@@ -0,0 +1,119 @@
+import argparse
+import csv
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+from Product_Detector_Heuristics import find_minimal_product_containers
+from Product_Detector_Parser import DEFAULT_BACKEND, PARSER_BACKENDS, make_soup
+from Product_Detector_Profiling import PROFILE_DIR, profiled, should_profile
+from Product_Detector_Store import get_pack
+from Product_Detector_Streaming import iter_file_chunks, stream_product_containers
+
+# Batch tools over saved pages, e.g.
+#   python Product_Detector_Batch.py detect "data/pages/*.html" --workers 8
+# Pages are spread over a process pool; each worker parses, detects and
+# appends its product snippets to the pack (see Product_Detector_Store.py),
+# and only small per-page stats come back.
+
+STATS_FIELDS = ['page', 'bytes', 'products', 'parse_s', 'detect_s', 'write_s']
+
+def expand_inputs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, '*.html'))))
+        else:
+            paths.extend(sorted(glob.glob(item)))
+    return paths
+
+def page_stem(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name[:-len('_page')] if name.endswith('_page') else name
+
+def write_snippets(products, pack_path, stem):
+    # Same snippet names as the app, so they can be found in the pack index
+    return get_pack(pack_path).append((f"{stem}_product_{i}.html", product) for i, product in enumerate(products))
+
+def detect_page(task):
+    path, pack_path, backend, streaming, profile_rate = task
+    stats = {'page': path, 'bytes': os.path.getsize(path)}
+    with profiled('batch_page', should_profile(sample_rate=profile_rate), PROFILE_DIR,
+                  page=path, page_bytes=stats['bytes']) as meta:
+        detect_page_stats(path, pack_path, backend, streaming, stats)
+        meta['products'] = stats['products']
+    return stats
+
+def detect_page_stats(path, pack_path, backend, streaming, stats):
+    start = time.perf_counter()
+    if streaming:
+        # Parsing and detection are interleaved in streaming mode
+        products = [p.html for p in stream_product_containers(iter_file_chunks(path))]
+        stats['parse_s'] = 0.0
+        stats['detect_s'] = time.perf_counter() - start
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            soup = make_soup(f.read(), backend)
+        parsed = time.perf_counter()
+        products = [str(p) for p in find_minimal_product_containers(soup)]
+        stats['parse_s'] = parsed - start
+        stats['detect_s'] = time.perf_counter() - parsed
+
+    start = time.perf_counter()
+    if pack_path:
+        write_snippets(products, pack_path, page_stem(path))
+    stats['write_s'] = time.perf_counter() - start
+    stats['products'] = len(products)
+
+def run_detect(args):
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        raise SystemExit("No pages matched")
+
+    tasks = [(path, args.pack, args.parser, args.streaming, args.profile) for path in paths]
+    rows = []
+    start = time.perf_counter()
+    with Pool(args.workers) as pool:
+        for stats in pool.imap_unordered(detect_page, tasks):
+            rows.append(stats)
+            if args.verbose:
+                print(f"{os.path.basename(stats['page'])}: {stats['products']} products")
+    elapsed = time.perf_counter() - start
+
+    rows.sort(key=lambda row: row['page'])
+    if args.stats:
+        with open(args.stats, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=STATS_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    products = sum(row['products'] for row in rows)
+    print(f"Processed {len(rows)} pages, {products} products in {elapsed:.2f}s "
+          f"({len(rows) / elapsed:.1f} pages/s, {products / elapsed:.1f} products/s)")
+    return rows
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch tools over saved pages")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    detect = commands.add_parser('detect', help="detect products in saved pages")
+    detect.add_argument('inputs', nargs='+', help="directories of *.html pages or glob patterns")
+    detect.add_argument('--pack', default='./data/batch_products.pack', help="pack for product snippets, empty to skip")
+    detect.add_argument('--stats', default='./data/batch_stats.csv', help="per-page stats CSV, empty to skip")
+    detect.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    detect.add_argument('--parser', choices=PARSER_BACKENDS, default=DEFAULT_BACKEND, help="HTML parser backend")
+    detect.add_argument('--streaming', action='store_true', help="use the streaming detector (needs --parser lxml)")
+    detect.add_argument('--profile', type=float, nargs='?', const=1.0, default=0.0,
+                        help=f"cProfile this fraction of the pages (all with no value) into {PROFILE_DIR}")
+    detect.add_argument('--verbose', action='store_true')
+    detect.set_defaults(func=run_detect)
+    return parser
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    if getattr(args, 'streaming', False) and args.parser != 'lxml':
+        # The streaming detector parses with lxml, whose snippets differ from html.parser's on some pages
+        parser.error("--streaming requires --parser lxml")
+    args.func(args)
@@ -0,0 +1,289 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from bs4 import BeautifulSoup
+
+import scipy.sparse as sp
+
+from Product_Detector_Heuristics import (SCANNER, contains_price_naive, contains_unit_naive,
+                                         find_minimal_product_containers, find_minimal_product_containers_naive)
+from Product_Detector_Models import MODEL_NAMES, ModelRegistry
+from Product_Detector_Parser import available_backends, default_backend, extract_text_from_tag, make_soup
+from Product_Detector_Predict import Predictor
+
+# Offline benchmark over the saved pages in data/pages. No network, browser or
+# database is needed.
+#
+#   python Product_Detector_Benchmark.py                  # heuristics: old vs new, with parity checks
+#   python Product_Detector_Benchmark.py --suite --json results.json
+#   python Product_Detector_Benchmark.py --suite --save-baseline
+#
+# The suite times every stage of the pipeline on the whole corpus (parse per
+# backend, detection, TF-IDF transform, predict per model, end to end per
+# page) and compares each stage against the stored baseline; it exits non-zero
+# when one got slower than baseline * (1 + tolerance).
+
+BASELINE_PATH = './data/benchmark_baseline.json'
+# Absolute slack on top of the tolerance, so stages of a few milliseconds do
+# not fail on timer noise
+BASELINE_SLACK_S = 0.005
+
+def load_pages(pages_dir, pattern='*.html'):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, pattern))):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+def best_time(func, arg, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_detection(pages, repeat=1):
+    # Compare the naive detector against the single-pass one on the same
+    # parsed tree, and check they return the very same tags.
+    rows = []
+    for name, html in pages:
+        soup = BeautifulSoup(html, "html.parser")
+        naive_time, naive = best_time(find_minimal_product_containers_naive, soup, repeat)
+        fast_time, fast = best_time(find_minimal_product_containers, soup, repeat)
+        same = len(naive) == len(fast) and all(a is b for a, b in zip(naive, fast))
+        rows.append({
+            'page': name,
+            'bytes': len(html),
+            'products': len(fast),
+            'naive_s': naive_time,
+            'single_pass_s': fast_time,
+            'same': same,
+        })
+    return rows
+
+def print_detection(rows):
+    print(f"{'page':<45} {'KB':>7} {'products':>8} {'naive s':>9} {'1-pass s':>9} {'speedup':>8}")
+    for row in rows:
+        speedup = row['naive_s'] / row['single_pass_s'] if row['single_pass_s'] else float('inf')
+        flag = '' if row['same'] else '  MISMATCH'
+        print(f"{row['page']:<45} {row['bytes'] // 1024:>7} {row['products']:>8} "
+              f"{row['naive_s']:>9.3f} {row['single_pass_s']:>9.3f} {speedup:>7.1f}x{flag}")
+    naive_total = sum(row['naive_s'] for row in rows)
+    fast_total = sum(row['single_pass_s'] for row in rows)
+    print(f"Total: naive {naive_total:.2f}s, single pass {fast_total:.2f}s "
+          f"({naive_total / fast_total:.1f}x faster)")
+
+def snippet_texts(snippets):
+    # Every tag text of every snippet, lowered like is_valid_product does
+    texts = []
+    for _, html in snippets:
+        soup = BeautifulSoup(html, "html.parser")
+        texts.extend(el.get_text().lower() for el in soup.find_all(True))
+    return texts
+
+SCANNER_ATTEMPTS = 3
+
+def bench_scanner(texts, repeat=9):
+    # Old separate price and unit checks against the scanner, best of
+    # `repeat` runs each
+    def run_naive():
+        return [(contains_price_naive(text), contains_unit_naive(text)) for text in texts]
+
+    def run_scanner():
+        return [(scan.price is not None, scan.unit is not None) for scan in map(SCANNER.scan, texts)]
+
+    # Alternated, so both see the same machine load
+    naive_time = scanner_time = None
+    for _ in range(repeat):
+        elapsed, naive = best_time(lambda _: run_naive(), None, 1)
+        naive_time = min(elapsed, naive_time or elapsed)
+        elapsed, scanned = best_time(lambda _: run_scanner(), None, 1)
+        scanner_time = min(elapsed, scanner_time or elapsed)
+    mismatches = [text for text, a, b in zip(texts, naive, scanned) if a != b]
+    return {'texts': len(texts), 'naive_s': naive_time, 'scanner_s': scanner_time, 'mismatches': mismatches}
+
+def print_scanner(result):
+    print(f"Scanner: {result['texts']} snippet texts, separate regexes {result['naive_s']:.3f}s, "
+          f"scanner {result['scanner_s']:.3f}s, {len(result['mismatches'])} mismatches")
+    for text in result['mismatches'][:5]:
+        print(f"  mismatch: {text[:80]!r}")
+
+def corpus_info(pages):
+    return {'pages': len(pages), 'bytes': sum(len(html) for _, html in pages)}
+
+def environment_info():
+    import bs4
+    import sklearn
+    import xgboost
+    try:
+        import lxml.etree
+        lxml_version = '.'.join(str(part) for part in lxml.etree.LXML_VERSION)
+    except ImportError:
+        lxml_version = None
+    return {'python': platform.python_version(), 'machine': platform.machine(),
+            'bs4': bs4.__version__, 'lxml': lxml_version,
+            'sklearn': sklearn.__version__, 'xgboost': xgboost.__version__}
+
+def bench_suite(pages, repeat=3, model_names=MODEL_NAMES, registry=None):
+    # Models are loaded before anything is timed; every stage reports the
+    # best of `repeat` runs over the whole corpus in 'seconds'
+    registry = registry or ModelRegistry()
+    predictors = [Predictor(name, registry) for name in model_names]
+    for predictor in predictors:
+        predictor.warm()
+    vectorizer = registry.get('vectorizer')
+    corpus = corpus_info(pages)
+    stages = {}
+
+    htmls = [html for _, html in pages]
+    for backend in available_backends():
+        seconds, _ = best_time(lambda htmls: [make_soup(html, backend) for html in htmls], htmls, repeat)
+        stages[f'parse[{backend}]'] = {'seconds': seconds, 'mb_per_s': corpus['bytes'] / seconds / 1e6}
+
+    soups = [make_soup(html) for html in htmls]
+    seconds, candidates = best_time(lambda soups: [find_minimal_product_containers(soup) for soup in soups],
+                                    soups, repeat)
+    products = sum(len(tags) for tags in candidates)
+    stages['detect'] = {'seconds': seconds, 'products': products,
+                        'pages_per_s': len(soups) / seconds, 'products_per_s': products / seconds}
+
+    page_texts = [extract_text_from_tag(soup) for soup in soups]
+    product_texts = [[extract_text_from_tag(tag) for tag in tags] for tags in candidates]
+    texts = page_texts + [text for page in product_texts for text in page]
+    seconds, _ = best_time(vectorizer.transform, texts, repeat)
+    stages['tfidf_transform'] = {'seconds': seconds, 'texts': len(texts), 'texts_per_s': len(texts) / seconds}
+
+    # The feature rows of every candidate of the corpus, as one matrix
+    X = sp.vstack([predictors[0].features(page_text, texts)
+                   for page_text, texts in zip(page_texts, product_texts) if texts], format='csr')
+    for predictor in predictors:
+        seconds, _ = best_time(predictor.model.predict, X, repeat)
+        stages[f'predict[{predictor.model_name}]'] = {'seconds': seconds, 'rows': X.shape[0],
+                                                      'us_per_row': seconds / X.shape[0] * 1e6}
+
+    # Parse, detect, extract, vectorize and classify, page by page, with the
+    # first model
+    per_page = []
+    for name, html in pages:
+        seconds, (found, _) = best_time(predictors[0].predict_html, html, repeat)
+        per_page.append({'page': name, 'bytes': len(html), 'products': len(found), 'seconds': seconds})
+    total = sum(row['seconds'] for row in per_page)
+    stages[f'end_to_end[{predictors[0].model_name}]'] = {
+        'seconds': total, 'mean_page_s': total / len(per_page),
+        'max_page_s': max(row['seconds'] for row in per_page)}
+
+    return {
+        'created_at': time.time(),
+        'repeat': repeat,
+        'backend': default_backend(),
+        'corpus': corpus,
+        'environment': environment_info(),
+        'stages': stages,
+        'pages': per_page,
+    }
+
+def compare_to_baseline(result, baseline, tolerance):
+    # Returns one row per stage found in both; 'regressed' is set when the
+    # stage got slower than the baseline allows
+    rows = []
+    for stage, current in result['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            continue
+        limit = base['seconds'] * (1 + tolerance) + BASELINE_SLACK_S
+        rows.append({'stage': stage, 'baseline_s': base['seconds'], 'seconds': current['seconds'],
+                     'ratio': current['seconds'] / base['seconds'] if base['seconds'] else float('inf'),
+                     'regressed': current['seconds'] > limit})
+    return rows
+
+def print_suite(result, comparison=None):
+    corpus = result['corpus']
+    print(f"Corpus: {corpus['pages']} pages, {corpus['bytes'] // 1024} KB, "
+          f"best of {result['repeat']}, default backend {result['backend']}")
+    baseline = {row['stage']: row for row in comparison or []}
+    print(f"{'stage':<28} {'seconds':>9} {'baseline':>9} {'ratio':>7}")
+    for stage, row in result['stages'].items():
+        base = baseline.get(stage)
+        extra = (f"{base['baseline_s']:>9.3f} {base['ratio']:>6.2f}x{'  REGRESSED' if base['regressed'] else ''}"
+                 if base else f"{'-':>9} {'-':>7}")
+        print(f"{stage:<28} {row['seconds']:>9.3f} {extra}")
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_json(data, path):
+    if path == '-':
+        json.dump(data, sys.stdout, indent=2)
+        print()
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+def run_suite(args):
+    result = bench_suite(load_pages(args.pages), args.repeat, args.models or MODEL_NAMES)
+    comparison = None
+    if args.save_baseline:
+        write_json(result, args.baseline)
+    elif os.path.exists(args.baseline):
+        baseline = load_json(args.baseline)
+        if baseline['corpus'] != result['corpus']:
+            raise SystemExit(f"{args.baseline} was recorded on a different corpus, "
+                             f"re-record it with --save-baseline")
+        comparison = compare_to_baseline(result, baseline, args.tolerance)
+        result['baseline'] = {'path': args.baseline, 'tolerance': args.tolerance, 'stages': comparison}
+    if args.json:
+        write_json(result, args.json)
+    if args.json != '-':
+        print_suite(result, comparison)
+        if args.save_baseline:
+            print(f"Baseline saved to {args.baseline}")
+        elif comparison is None:
+            print(f"No baseline at {args.baseline}, nothing compared")
+    regressed = [row['stage'] for row in comparison or [] if row['regressed']]
+    if regressed:
+        raise SystemExit(f"Slower than the baseline (+{args.tolerance:.0%}): {', '.join(regressed)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark product detection on saved pages")
+    parser.add_argument('--pages', default='./data/pages', help="directory with saved *_page.html files")
+    parser.add_argument('--products', default='./data/products', help="directory with saved product snippets")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per page, the best one is reported")
+    parser.add_argument('--suite', action='store_true', help="time every pipeline stage instead")
+    parser.add_argument('--models', nargs='+', choices=MODEL_NAMES,
+                        help="models for the suite, default all; the first one is used end to end")
+    parser.add_argument('--json', help="write the suite results as JSON to this file, - for stdout")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="stored results to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown per stage before the suite fails (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.suite:
+        run_suite(args)
+        raise SystemExit(0)
+
+    # Timings on a busy machine jitter by more than the margin, so a slower
+    # scanner is measured again before the run fails
+    texts = snippet_texts(load_pages(args.products))
+    for _ in range(SCANNER_ATTEMPTS):
+        scanner_result = bench_scanner(texts)
+        print_scanner(scanner_result)
+        if scanner_result['mismatches'] or scanner_result['scanner_s'] <= scanner_result['naive_s']:
+            break
+    rows = bench_detection(load_pages(args.pages), args.repeat)
+    print_detection(rows)
+    if scanner_result['mismatches']:
+        raise SystemExit("Scanner disagrees with the separate price/unit checks")
+    if scanner_result['scanner_s'] > scanner_result['naive_s']:
+        raise SystemExit("Scanner is slower than the separate price/unit checks")
+    if not all(row['same'] for row in rows):
+        raise SystemExit("Single-pass detector disagrees with the naive detector")
@@ -0,0 +1,154 @@
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+
+from Product_Detector_Readiness import wait_for_page
+
+# Pool of long-lived Chrome sessions. Starting Chrome takes seconds, so
+# drivers are kept warm and handed out one request at a time:
+#
+#   with get_browser_pool().driver() as driver:
+#       driver.get(url)
+#
+# Drivers are reset (cookies, extra tabs) when they come back, and are thrown
+# away after max_uses checkouts or when the code using them raises.
+
+CHROMEDRIVER_PATH = "chromedriver.exe"
+
+def create_chrome_driver(headless=True):
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument("--headless")
+    service = Service(CHROMEDRIVER_PATH)
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+class _PooledDriver:
+    __slots__ = ('driver', 'uses')
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+class BrowserPool:
+
+    def __init__(self, size=2, max_uses=50, headless=True, driver_factory=None):
+        self.size = size
+        self.max_uses = max_uses
+        self.headless = headless
+        self.driver_factory = driver_factory or create_chrome_driver
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        # Updated by every thread using the pool, under _lock
+        self.stats = {'created': 0, 'recycled': 0, 'failed': 0, 'checkouts': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    @contextmanager
+    def driver(self, timeout=None):
+        # Blocks until one of the size slots is free
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No browser session available")
+        entry = None
+        try:
+            entry = self._checkout()
+            yield entry.driver
+        except Exception:
+            if entry is not None:
+                self._count('failed')
+                self._discard(entry)
+                entry = None
+            raise
+        finally:
+            if entry is not None:
+                self._checkin(entry)
+            self._slots.release()
+
+    def _checkout(self):
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        self._count('checkouts')
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                self._count('created')
+                return _PooledDriver(self.driver_factory(self.headless))
+            if self._is_alive(entry):
+                return entry
+            self._discard(entry)
+
+    def _checkin(self, entry):
+        entry.uses += 1
+        if self._closed or entry.uses >= self.max_uses:
+            self._count('recycled')
+            self._discard(entry)
+            return
+        try:
+            self._reset(entry.driver)
+        except Exception:
+            self._count('failed')
+            self._discard(entry)
+            return
+        self._idle.put(entry)
+
+    def _reset(self, driver):
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+        # delete_all_cookies only covers the current domain
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+
+    def _is_alive(self, entry):
+        try:
+            entry.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, entry):
+        try:
+            entry.driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+def get_browser_pool(size=2, max_uses=50, headless=True):
+    # Process-wide pool shared by the app and the scripts. The arguments
+    # only apply to the first call.
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool(size=size, max_uses=max_uses, headless=headless)
+            atexit.register(_shared_pool.close)
+        return _shared_pool
+
+def fetch_rendered_page(url, pool=None, settings=None):
+    # Loads url in a pooled browser and waits until it is ready. Returns the
+    # page source and the ReadinessReport.
+    pool = pool or get_browser_pool()
+    with pool.driver() as driver:
+        driver.get(url)
+        report = wait_for_page(driver, url, settings)
+        return driver.page_source, report
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# On-disk cache of fetched pages, keyed by normalized URL. Entries expire
+# after ttl_s and the least recently used ones are evicted once the cache is
+# over max_bytes. Pages are stored compressed: zstd when the zstandard package
+# is installed, gzip otherwise. Both can be read back whichever is in use.
+
+TRACKING_PARAMS = ('utm_', 'gclid', 'fbclid', 'yclid', '_ga')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    # Same page, same key: lower-case scheme and host, no default port, no
+    # fragment, no tracking parameters, sorted query
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith(TRACKING_PARAMS)]
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(sorted(query)), ''))
+
+def compress(data, codec):
+    if codec == 'zst':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+def decompress(data, codec):
+    if codec == 'zst':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class PageCache:
+
+    def __init__(self, directory, ttl_s=3600, max_bytes=200 * 1024 * 1024, codec=None):
+        self.directory = directory
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.codec = codec or ('zst' if zstandard else 'gz')
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        # key -> (path, size, stored_at), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Rebuild the index from disk, oldest first. Temporary files are
+        # left over from writes interrupted by a crash
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                self._remove_file(os.path.join(self.directory, name))
+                continue
+            key, _, codec = name.partition('.html.')
+            if codec not in ('gz', 'zst') or (codec == 'zst' and zstandard is None):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, key, path, stat.st_size))
+        for stored_at, key, path, size in sorted(files):
+            self._add(key, path, size, stored_at)
+        self._evict()
+
+    def _key(self, url):
+        return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def _add(self, key, path, size, stored_at):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+            if old[0] != path:
+                self._remove_file(old[0])
+        self._entries[key] = (path, size, stored_at)
+        self._bytes += size
+
+    def _drop(self, key):
+        path, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self._remove_file(path)
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+
+    def get(self, url):
+        key = self._key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            path, _, stored_at = entry
+            if time.time() - stored_at > self.ttl_s:
+                self._drop(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(path, 'rb') as f:
+                html = decompress(f.read(), path.rsplit('.', 1)[-1]).decode('utf-8')
+        except Exception:
+            # Missing or damaged file (OSError, bad gzip/zstd data, bad UTF-8)
+            with self._lock:
+                if self._entries.get(key) == entry:
+                    self._drop(key)
+                self.stats['misses'] += 1
+            return None
+        with self._lock:
+            self.stats['hits'] += 1
+        return html
+
+    def put(self, url, html):
+        key = self._key(url)
+        data = compress(html.encode('utf-8'), self.codec)
+        path = os.path.join(self.directory, f"{key}.html.{self.codec}")
+        # Write then rename, so readers never see half a file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._add(key, path, len(data), time.time())
+            self._evict()
+
+    def summary(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats,
+                        entries=len(self._entries),
+                        bytes=self._bytes,
+                        codec=self.codec,
+                        hit_rate=self.stats['hits'] / lookups if lookups else 0.0)
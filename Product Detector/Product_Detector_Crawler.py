@@ -0,0 +1,185 @@
+import argparse
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from urllib.parse import urlparse
+
+from Product_Detector_Browser import fetch_rendered_page, get_browser_pool
+from Product_Detector_Fetcher import TieredFetcher
+from Product_Detector_Store import get_pack
+from Product_Detector_Streaming import iter_file_chunks, stream_product_containers
+
+# Concurrent crawl over a seed file, e.g.
+#   python Product_Detector_Crawler.py seeds.txt --workers 4 --per-host 1 --delay 3
+# Worker threads take URLs as soon as their host allows it: at most per_host
+# fetches run against a host at once, and starts on the same host are at
+# least delay_s apart. Products are detected in the main thread as pages
+# arrive, so fetching is only limited by the browser pool.
+
+def read_seed_file(path):
+    # One URL per line. Lines like "<id> : <url>" (data/outbound_test_urls.txt)
+    # keep only the URL after the last " : ".
+    urls = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            url = line.rsplit(' : ', 1)[-1].strip()
+            if url.startswith('http'):
+                urls.append(url)
+    return urls
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+class CrawlResult:
+    __slots__ = ('url', 'html', 'products', 'error', 'fetch_s')
+
+    def __init__(self, url, html, products, error, fetch_s):
+        self.url = url
+        self.html = html
+        # Product markup when the fetch already detected it, otherwise None
+        self.products = products
+        self.error = error
+        self.fetch_s = fetch_s
+
+class CrawlScheduler:
+    # fetch(url) returns (html, products), with products None when the
+    # page still has to be detected
+
+    def __init__(self, fetch, workers=2, per_host=1, delay_s=2.0):
+        self.fetch = fetch
+        self.workers = workers
+        self.per_host = per_host
+        self.delay_s = delay_s
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._active = Counter()
+        self._next_start = {}
+
+    def _take(self):
+        # Next URL whose host has a free slot and is past its politeness
+        # delay; waits until one is, or returns None when nothing is left
+        with self._cond:
+            while self._pending:
+                now = time.monotonic()
+                wait = None
+                for i, url in enumerate(self._pending):
+                    host = host_of(url)
+                    if self._active[host] >= self.per_host:
+                        continue
+                    ready_at = self._next_start.get(host, 0.0)
+                    if ready_at <= now:
+                        del self._pending[i]
+                        self._active[host] += 1
+                        self._next_start[host] = now + self.delay_s
+                        return url
+                    wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                self._cond.wait(wait)
+            return None
+
+    def _release(self, url):
+        with self._cond:
+            self._active[host_of(url)] -= 1
+            self._cond.notify_all()
+
+    def _work(self, results):
+        while True:
+            url = self._take()
+            if url is None:
+                return
+            start = time.perf_counter()
+            try:
+                html, products = self.fetch(url)
+                result = CrawlResult(url, html, products, None, 0.0)
+            except Exception as e:
+                result = CrawlResult(url, None, None, e, 0.0)
+            finally:
+                self._release(url)
+            result.fetch_s = time.perf_counter() - start
+            with results:
+                results.items.append(result)
+                results.notify()
+
+    def run(self, urls):
+        # Yields CrawlResult objects in completion order
+        with self._cond:
+            self._pending.extend(urls)
+        total = len(urls)
+        results = threading.Condition()
+        results.items = deque()
+        threads = [threading.Thread(target=self._work, args=(results,), daemon=True)
+                   for _ in range(min(self.workers, total))]
+        for thread in threads:
+            thread.start()
+
+        for _ in range(total):
+            with results:
+                while not results.items:
+                    results.wait()
+                result = results.items.popleft()
+            yield result
+
+        for thread in threads:
+            thread.join()
+
+def save_crawl_result(result, output_dir):
+    # Same layout as the app: pages/<id>_page.html, and <id>_product_<i>.html
+    # snippets appended to products.pack
+    crawl_id = str(uuid.uuid4())
+    page_path = os.path.join(output_dir, 'pages', f"{crawl_id}_page.html")
+    with open(page_path, 'w', encoding='utf-8') as f:
+        f.write(result.html)
+    products = result.products
+    if products is None:
+        # Detect from the saved file, in chunks
+        products = (product.html for product in stream_product_containers(iter_file_chunks(page_path)))
+    refs = get_pack(os.path.join(output_dir, 'products.pack')).append(
+        (f"{crawl_id}_product_{i}.html", product) for i, product in enumerate(products))
+    return crawl_id, len(refs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch a seed file concurrently and detect products")
+    parser.add_argument('seeds', help="seed file, one URL per line")
+    parser.add_argument('--output', default='./data/crawl')
+    parser.add_argument('--workers', type=int, default=2, help="concurrent fetches, also the browser pool size")
+    parser.add_argument('--per-host', type=int, default=1, help="concurrent fetches per host")
+    parser.add_argument('--delay', type=float, default=2.0, help="seconds between fetch starts on one host")
+    parser.add_argument('--headed', action='store_true', help="show the browser windows")
+    parser.add_argument('--browser-only', action='store_true', help="skip the plain HTTP attempt")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.output, 'pages'), exist_ok=True)
+
+    pool = get_browser_pool(size=args.workers, headless=not args.headed)
+    browser_fetch = lambda url: fetch_rendered_page(url, pool)[0]
+    if args.browser_only:
+        fetch = lambda url: (browser_fetch(url), None)
+    else:
+        # The HTTP tier detects with lxml, like the streaming detector used for the other pages
+        fetcher = TieredFetcher(browser_fetch, parser='lxml', tiers_path=os.path.join(args.output, 'fetch_tiers.json'))
+
+        def fetch(url):
+            fetched = fetcher.fetch(url)
+            return fetched.html, fetched.products
+
+    scheduler = CrawlScheduler(fetch, workers=args.workers, per_host=args.per_host, delay_s=args.delay)
+
+    urls = read_seed_file(args.seeds)
+    start = time.perf_counter()
+    pages = products = 0
+    for result in scheduler.run(urls):
+        if result.error is not None:
+            print(f"Failed {result.url}: {result.error}")
+            continue
+        crawl_id, count = save_crawl_result(result, args.output)
+        pages += 1
+        products += count
+        print(f"{result.url}: {count} products in {result.fetch_s:.1f}s fetch ({crawl_id})")
+
+    elapsed = time.perf_counter() - start
+    print(f"Crawled {pages}/{len(urls)} pages, {products} products in {elapsed:.1f}s "
+          f"({pages / elapsed:.2f} pages/s)")
@@ -0,0 +1,362 @@
+import argparse
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Database access shared by the app and the training scripts. Connections
+# come from a pool instead of being opened per request, the train_data table
+# is created once per process, and labels are written with executemany.
+#
+# MySQL is the default. Set PRODUCT_DETECTOR_DB=sqlite:<path> to use a local
+# SQLite file instead, e.g. for trying the app or the benchmark without a
+# MySQL server:
+#
+#   python Product_Detector_DB.py bench --rows 2000
+
+db_config = {
+    'host': '127.0.0.1',
+    'user': 'root',
+    'password': 'anan123',
+    'database': 'product_detecting',
+    'autocommit': False,
+}
+
+POOL_SIZE = int(os.environ.get('PRODUCT_DETECTOR_DB_POOL', 5))
+# MySQLConnectionPool raises PoolError as soon as it is empty, so callers
+# wait up to this long for a free connection instead
+POOL_TIMEOUT = 30
+INSERT_BATCH = 1000  # rows per executemany, keeps MySQL packets small
+
+SCHEMA = {
+    'mysql': """
+        CREATE TABLE IF NOT EXISTS train_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            session_id VARCHAR(36) NOT NULL,
+            url VARCHAR(255) NOT NULL,
+            page_path TEXT NOT NULL,
+            product_path TEXT NOT NULL,
+            label INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX (session_id)
+        )
+    """,
+    'sqlite': """
+        CREATE TABLE IF NOT EXISTS train_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id VARCHAR(36) NOT NULL,
+            url VARCHAR(255) NOT NULL,
+            page_path TEXT NOT NULL,
+            product_path TEXT NOT NULL,
+            label INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+SQLITE_INDEX = "CREATE INDEX IF NOT EXISTS train_data_session_id ON train_data (session_id)"
+
+TRAIN_COLUMNS = ['url', 'page_path', 'product_path', 'label', 'created_at']
+
+class SQLitePool:
+    # Same get_connection() interface as MySQLConnectionPool; close() on the
+    # returned wrapper hands the connection back
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get_connection(self):
+        self._slots.acquire()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        return _PooledSQLite(self, conn)
+
+    def _put(self, conn):
+        self._idle.put(conn)
+        self._slots.release()
+
+class _PooledSQLite:
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.rollback()
+            self._pool._put(self._conn)
+            self._conn = None
+
+class Database:
+
+    def __init__(self, url=None, size=POOL_SIZE):
+        url = url or os.environ.get('PRODUCT_DETECTOR_DB', 'mysql')
+        if url.startswith('sqlite:'):
+            self.dialect = 'sqlite'
+            self.placeholder = '?'
+            self._pool = SQLitePool(url[len('sqlite:'):], size)
+        elif url == 'mysql':
+            from mysql.connector import pooling
+            self.dialect = 'mysql'
+            self.placeholder = '%s'
+            self._pool = pooling.MySQLConnectionPool(pool_name='product_detector', pool_size=size,
+                                                     pool_reset_session=True, **db_config)
+        else:
+            raise ValueError(f"Unknown database: {url}")
+        self._slots = threading.BoundedSemaphore(size)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        # Commits when the block succeeds, rolls back when it raises. Waits
+        # for a free connection when all of them are in use
+        if not self._slots.acquire(timeout=POOL_TIMEOUT):
+            raise TimeoutError(f"No database connection free after {POOL_TIMEOUT}s")
+        try:
+            conn = self._pool.get_connection()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    def ensure_schema(self):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SCHEMA[self.dialect])
+                if self.dialect == 'sqlite':
+                    cursor.execute(SQLITE_INDEX)
+                cursor.close()
+            self._schema_ready = True
+
+    def insert_labels(self, session_id, url, page_path, product_paths, labels, replace=False):
+        # One transaction per call, executemany in batches. mysql-connector
+        # rewrites executemany INSERTs into multi-row INSERT statements. With
+        # replace, products of the session that already have a row get their
+        # label updated in place (keeping the row's id), so a page of labels
+        # can be submitted again; only the new ones are inserted.
+        self.ensure_schema()
+        p = self.placeholder
+        query = (f"INSERT INTO train_data (session_id, url, page_path, product_path, label) "
+                 f"VALUES ({p}, {p}, {p}, {p}, {p})")
+        rows = [(session_id, url, page_path, product_path, label)
+                for product_path, label in zip(product_paths, labels)]
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(rows), INSERT_BATCH):
+                batch = rows[start:start + INSERT_BATCH]
+                if replace:
+                    batch = self._update_existing(cursor, session_id, batch)
+                if batch:
+                    cursor.executemany(query, batch)
+            cursor.close()
+        return len(rows)
+
+    def _update_existing(self, cursor, session_id, rows):
+        # Updates the rows of the session already labeled, with one SELECT
+        # and one UPDATE per label value; returns the rows still to insert
+        p = self.placeholder
+        labels = {row[3]: row[4] for row in rows}
+        cursor.execute(f"SELECT id, product_path, label FROM train_data WHERE session_id = {p} "
+                       f"AND product_path IN ({', '.join([p] * len(labels))})", [session_id, *labels])
+        changed = {}
+        existing = set()
+        for row_id, product_path, label in cursor.fetchall():
+            existing.add(product_path)
+            if label != labels[product_path]:
+                changed.setdefault(labels[product_path], []).append(row_id)
+        for label, ids in changed.items():
+            cursor.execute(f"UPDATE train_data SET label = {p} WHERE id IN ({', '.join([p] * len(ids))})",
+                           [label, *ids])
+        # A product sent twice in one call is inserted once, with its last label
+        new_rows = {row[3]: row for row in rows if row[3] not in existing}
+        return [row[:4] + (labels[row[3]],) for row in new_rows.values()]
+
+    def fetch_train_data(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {', '.join(TRAIN_COLUMNS)} FROM train_data")
+            rows = [dict(zip(TRAIN_COLUMNS, row)) for row in cursor.fetchall()]
+            cursor.close()
+        return rows
+
+    def fetch_train_data_since(self, last_id=0, limit=None):
+        # Rows added after last_id, oldest first, with their id
+        p = self.placeholder
+        query = f"SELECT id, {', '.join(TRAIN_COLUMNS)} FROM train_data WHERE id > {p} ORDER BY id"
+        params = [last_id]
+        if limit is not None:
+            query += f" LIMIT {p}"
+            params.append(limit)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = [dict(zip(['id'] + TRAIN_COLUMNS, row)) for row in cursor.fetchall()]
+            cursor.close()
+        return rows
+
+    def ping(self):
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                cursor.close()
+            return True
+        except Exception as e:
+            print(f"Database connection failed: {e}")
+            return False
+
+_shared_db = None
+_shared_lock = threading.Lock()
+
+def get_database():
+    global _shared_db
+    with _shared_lock:
+        if _shared_db is None:
+            _shared_db = Database()
+        return _shared_db
+
+def bench_label_inserts(db, rows, repeat=3):
+    # Row-at-a-time inserts (the old save_labels loop) against insert_labels,
+    # and insert_labels(replace=True) as save_labels calls it, once for new
+    # labels and once resending all of them with every other one changed
+    db.ensure_schema()
+    p = db.placeholder
+    query = (f"INSERT INTO train_data (session_id, url, page_path, product_path, label) "
+             f"VALUES ({p}, {p}, {p}, {p}, {p})")
+    product_paths = [f"./data/products.pack#{i * 1000}:1000" for i in range(rows)]
+    labels = [i % 2 for i in range(rows)]
+    changed = [1 - label if i % 2 else label for i, label in enumerate(labels)]
+    results = {'rows': rows, 'row_by_row_s': None, 'batched_s': None, 'replace_new_s': None,
+               'replace_resend_s': None}
+
+    def best(key, elapsed):
+        results[key] = min(elapsed, results[key] or elapsed)
+
+    session_ids = []
+    for _ in range(repeat):
+        session_id = str(uuid.uuid4())
+        session_ids.append(session_id)
+        start = time.perf_counter()
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            for product_path, label in zip(product_paths, labels):
+                cursor.execute(query, (session_id, 'bench', 'bench', product_path, label))
+            cursor.close()
+        best('row_by_row_s', time.perf_counter() - start)
+
+        session_id = str(uuid.uuid4())
+        session_ids.append(session_id)
+        start = time.perf_counter()
+        db.insert_labels(session_id, 'bench', 'bench', product_paths, labels)
+        best('batched_s', time.perf_counter() - start)
+
+        session_id = str(uuid.uuid4())
+        session_ids.append(session_id)
+        start = time.perf_counter()
+        db.insert_labels(session_id, 'bench', 'bench', product_paths, labels, replace=True)
+        best('replace_new_s', time.perf_counter() - start)
+        start = time.perf_counter()
+        db.insert_labels(session_id, 'bench', 'bench', product_paths, changed, replace=True)
+        best('replace_resend_s', time.perf_counter() - start)
+
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*), SUM(label) FROM train_data WHERE session_id = {p}", (session_id,))
+            count, total = cursor.fetchone()
+            cursor.close()
+        if count != rows or total != sum(changed):
+            raise RuntimeError(f"replace left {count} rows with {total} positive labels, "
+                               f"expected {rows} and {sum(changed)}")
+
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(f"DELETE FROM train_data WHERE session_id = {p}", [(s,) for s in session_ids])
+        cursor.close()
+    return results
+
+def check_pool(db, threads, hold_s=0.05):
+    # More concurrent connection() blocks than the pool holds; every one
+    # must get a connection, the extra ones by waiting
+    errors = []
+    in_use = [0, 0]
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            with db.connection() as conn:
+                with lock:
+                    in_use[0] += 1
+                    in_use[1] = max(in_use[1], in_use[0])
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                cursor.close()
+                time.sleep(hold_s)
+                with lock:
+                    in_use[0] -= 1
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {'threads': threads, 'max_in_use': in_use[1], 'errors': errors}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('init', help="create the train_data table")
+    bench = commands.add_parser('bench', help="time label inserts and resubmissions for one large session")
+    bench.add_argument('--rows', type=int, default=2000)
+    bench.add_argument('--repeat', type=int, default=3)
+    bench.add_argument('--db', default=None, help="mysql or sqlite:<path>, default PRODUCT_DETECTOR_DB "
+                                                  "or a temporary SQLite file")
+    pool = commands.add_parser('check-pool', help="open more connections at once than the pool holds")
+    pool.add_argument('--threads', type=int, default=POOL_SIZE * 4)
+    pool.add_argument('--db', default=None, help="mysql or sqlite:<path>, default PRODUCT_DETECTOR_DB "
+                                                 "or a temporary SQLite file")
+    args = parser.parse_args()
+
+    if args.command == 'check-pool':
+        db_url = args.db or os.environ.get('PRODUCT_DETECTOR_DB') or \
+            'sqlite:' + os.path.join(tempfile.gettempdir(), 'product_detector_bench.sqlite3')
+        result = check_pool(Database(db_url), args.threads)
+        print(f"{result['threads']} concurrent connection() blocks, at most {result['max_in_use']} "
+              f"connections in use, {len(result['errors'])} errors")
+        if result['errors']:
+            raise SystemExit(f"Pool failed: {result['errors'][0]!r}")
+    elif args.command == 'init':
+        get_database().ensure_schema()
+        print("train_data is ready")
+    else:
+        db_url = args.db or os.environ.get('PRODUCT_DETECTOR_DB') or \
+            'sqlite:' + os.path.join(tempfile.gettempdir(), 'product_detector_bench.sqlite3')
+        result = bench_label_inserts(Database(db_url), args.rows, args.repeat)
+        print(f"{result['rows']} labels: row by row {result['row_by_row_s']:.3f}s, "
+              f"executemany {result['batched_s']:.3f}s "
+              f"({result['row_by_row_s'] / result['batched_s']:.1f}x)")
+        print(f"replace: new labels {result['replace_new_s']:.3f}s, "
+              f"all labels sent again {result['replace_resend_s']:.3f}s")
@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from tqdm import tqdm
+
+from Product_Detector_Parser import TEXT_TAGS, default_backend, extract_text_from_html
+from Product_Detector_Store import DEFAULT_PRODUCTS_DIR, file_name, parse_ref, read_product
+
+# Persistent cache of the texts the training scripts extract from pages and
+# product snippets. Parsing a page is by far the slowest step of training and
+# each page is shared by dozens of labeled rows, so every file is parsed once
+# and its text kept in a SQLite file shared by all the training scripts.
+#
+# Entries are keyed by path and checked against a SHA-1 of the content (and of
+# the extractor settings), so an edited page or snippet is parsed again on the
+# next run. Within a run, page texts are also kept in memory as long as the
+# file's size and mtime do not change, so a page is read only once.
+#
+# extract_rows() handles a whole training set: every distinct file is looked
+# up once and the misses are parsed on a process pool (BeautifulSoup holds the
+# GIL, threads do not help), the workers sending back plain text only. Entries
+# also record a version of their source (size and mtime of a file, or the
+# pack reference itself, as pack bytes are never rewritten), so unchanged
+# files are not even read; the others are read once, by the worker, which
+# only parses them when the digest differs from the stored one. Set
+# PRODUCT_DETECTOR_FEATURE_WORKERS to change the pool size (default: one per
+# core, 1 parses in this process).
+#
+#   python Product_Detector_Features.py stats
+#   python Product_Detector_Features.py clear
+
+DEFAULT_FEATURE_CACHE = './data/feature_cache.sqlite3'
+PAGES_DIR = './data/pages'
+FEATURE_WORKERS = int(os.environ.get('PRODUCT_DETECTOR_FEATURE_WORKERS', 0)) or os.cpu_count() or 1
+# Snippets are small, send them to the workers in chunks of about this many
+PRODUCT_CHUNK = 64
+
+def page_file(page_path, pages_dir=PAGES_DIR):
+    # page_path as stored in train_data, possibly a Windows path
+    return os.path.join(pages_dir, page_path.split("\\")[-1])
+
+def content_digest(content, extractor):
+    digest = hashlib.sha1(extractor.encode('utf-8'))
+    digest.update(content.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+def read_source(kind, key):
+    # Content of a page file or product snippet, "" when it is missing
+    if kind == 'product':
+        return read_product(key)
+    try:
+        with open(key, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"File not found: {key}")
+        return ""
+
+def source_version(kind, key, extractor):
+    # Changes whenever the content or the extractor may have changed, None
+    # when only the content can tell
+    path = key
+    if kind == 'product':
+        if parse_ref(key) is not None:
+            return f"{extractor}|{key}"
+        # Legacy snippet file, read from the pack once it was migrated
+        path = os.path.join(DEFAULT_PRODUCTS_DIR, file_name(key))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{extractor}|{stat.st_size}:{stat.st_mtime_ns}"
+
+def extract_file(task):
+    # Runs in a pool worker: reads one file and parses it unless its digest
+    # is the stored one. Returns (key, digest, text), text None when
+    # unchanged and digest None when the file is missing or empty
+    kind, key, backend, extractor, stored_digest = task
+    content = read_source(kind, key)
+    if not content:
+        return key, None, ""
+    digest = content_digest(content, extractor)
+    if digest == stored_digest:
+        return key, digest, None
+    return key, digest, extract_text_from_html(content, backend)
+
+class FeatureCache:
+
+    def __init__(self, path=DEFAULT_FEATURE_CACHE, backend=None):
+        self.path = path
+        self.backend = backend or default_backend()
+        # Texts depend on the parser and on the tags extracted
+        self.extractor = f"{self.backend}:{','.join(TEXT_TAGS)}"
+        # Updated by every thread using the cache, under _lock
+        self.stats = {'hits': 0, 'misses': 0}
+        self._local = threading.local()
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS texts (
+                    path TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(texts)")]
+            if 'version' not in columns:
+                conn.execute("ALTER TABLE texts ADD COLUMN version TEXT")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self.stats[stat] += n
+
+    def _key_lock(self, key):
+        # Threads asking for the same file wait for the one parsing it
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def text(self, key, content):
+        # Text of `content`, stored under `key` (a file path or pack reference)
+        digest = content_digest(content, self.extractor)
+        row = self._connect().execute("SELECT digest, text FROM texts WHERE path = ?", (key,)).fetchone()
+        if row is not None and row[0] == digest:
+            self._count('hits')
+            return row[1]
+        self._count('misses')
+        text = extract_text_from_html(content, self.backend)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO texts (path, digest, text, created_at) VALUES (?, ?, ?, ?)",
+                         (key, digest, text, time.time()))
+        return text
+
+    def page_text(self, page_path):
+        path = page_file(page_path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            print(f"File not found: {path}")
+            return ""
+        version = (stat.st_size, stat.st_mtime_ns)
+        with self._key_lock(path):
+            cached = self._pages.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            with open(path, 'r', encoding='utf-8') as f:
+                text = self.text(path, f.read())
+            self._pages[path] = (version, text)
+            return text
+
+    def product_text(self, product_path):
+        # product_path is a pack reference or a legacy data/products path
+        with self._key_lock(product_path):
+            return self.text(product_path, read_product(product_path))
+
+    def row_texts(self, row):
+        # (page_text, product_text) of a train_data row
+        return self.page_text(row['page_path']), self.product_text(row['product_path'])
+
+    def extract_rows(self, rows, workers=FEATURE_WORKERS, progress=True):
+        # [(page_text, product_text)] for train_data rows, in order
+        sources = {}
+        for row in rows:
+            sources[page_file(row['page_path'])] = 'page'
+            sources[row['product_path']] = 'product'
+
+        texts = {}
+        stored = {}
+        todo = []
+        conn = self._connect()
+        for key, kind in sources.items():
+            version = source_version(kind, key, self.extractor)
+            row = conn.execute("SELECT digest, text, version FROM texts WHERE path = ?", (key,)).fetchone()
+            if row is not None and version is not None and row[2] == version:
+                texts[key] = row[1]
+                continue
+            if row is not None:
+                stored[key] = row[1]
+            size = int(version.rsplit('|', 1)[1].split(':')[0]) if kind == 'page' and version else 0
+            todo.append((size, (kind, key, self.backend, self.extractor, row[0] if row else None), version))
+        self._count('hits', len(sources) - len(todo))
+
+        if todo:
+            # Largest pages first so no worker is left with a big one at the end
+            todo.sort(key=lambda item: item[0], reverse=True)
+            versions = {task[1]: version for _, task, version in todo}
+            pages = [task for _, task, _ in todo if task[0] == 'page']
+            products = [task for _, task, _ in todo if task[0] == 'product']
+            with tqdm(total=len(todo), desc="Parsing files", unit="file", disable=not progress) as bar:
+                if workers <= 1:
+                    results = map(extract_file, pages + products)
+                    extracted = self._store_results(results, texts, stored, versions, bar)
+                else:
+                    with ProcessPoolExecutor(max_workers=workers) as executor:
+                        chunk = max(1, min(PRODUCT_CHUNK, len(products) // (workers * 4)))
+                        results = chain(executor.map(extract_file, pages),
+                                        executor.map(extract_file, products, chunksize=chunk))
+                        extracted = self._store_results(results, texts, stored, versions, bar)
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO texts (path, digest, text, version, created_at) "
+                                 "VALUES (?, ?, ?, ?, ?)", extracted)
+
+        return [(texts[page_file(row['page_path'])], texts[row['product_path']]) for row in rows]
+
+    def _store_results(self, results, texts, stored, versions, bar):
+        extracted = []
+        now = time.time()
+        for key, digest, text in results:
+            bar.update()
+            if digest is None:
+                texts[key] = ""
+                continue
+            # Unchanged content keeps its text and only gets the new version
+            self._count('hits' if text is None else 'misses')
+            if text is None:
+                text = stored[key]
+            texts[key] = text
+            extracted.append((key, digest, text, versions[key], now))
+        return extracted
+
+    def summary(self):
+        entries, text_bytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(text)), 0) FROM texts").fetchone()
+        with self._lock:
+            return dict(self.stats, path=self.path, entries=entries, text_bytes=text_bytes)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM texts")
+        self._pages.clear()
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def get_feature_cache():
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = FeatureCache()
+        return _shared_cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the training feature cache")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('--cache', default=DEFAULT_FEATURE_CACHE)
+    args = parser.parse_args()
+
+    cache = FeatureCache(args.cache)
+    if args.command == 'clear':
+        cache.clear()
+    stats = cache.summary()
+    print(f"{stats['path']}: {stats['entries']} entries, {stats['text_bytes'] // 1024} KB of text")
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from bs4.dammit import UnicodeDammit
+from requests.adapters import HTTPAdapter
+
+from Product_Detector_Heuristics import find_minimal_product_containers
+from Product_Detector_Parser import make_soup
+
+# Tiered page fetching. Many retailers render the product grid on the server,
+# so a plain HTTP request is tried first and the page is only loaded in Chrome
+# when the HTTP response has too few product containers. The tier that worked
+# is remembered per host, so later fetches go straight to it; a host sent to
+# the browser gets another HTTP try once BROWSER_TIER_TTL has passed.
+
+TIER_HTTP = 'http'
+TIER_BROWSER = 'browser'
+BROWSER_TIER_TTL = 24 * 3600
+
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'tr-TR,tr;q=0.9,en;q=0.8',
+}
+
+def create_http_session(pool_size=16):
+    # Keep-alive connections are reused per host across fetches
+    http = requests.Session()
+    http.headers.update(HTTP_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    return http
+
+_shared_session = None
+_shared_lock = threading.Lock()
+
+def get_http_session():
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = create_http_session()
+        return _shared_session
+
+class FetchResult:
+    __slots__ = ('url', 'html', 'tier', 'products', 'timings')
+
+    def __init__(self, url, html, tier, products=None, timings=None):
+        self.url = url
+        self.html = html
+        self.tier = tier
+        # Markup of the detected containers when the HTTP tier was used, so
+        # callers do not have to detect twice
+        self.products = products
+        # Seconds per stage ('parse', 'detect') of the HTTP tier's detection,
+        # also when it found too few products and the browser was used
+        self.timings = timings or {}
+
+class TieredFetcher:
+
+    def __init__(self, browser_fetch, min_products=3, timeout=15, parser=None,
+                 http_session=None, tiers_path=None):
+        self.browser_fetch = browser_fetch
+        self.min_products = min_products
+        self.timeout = timeout
+        self.parser = parser
+        self.http = http_session or get_http_session()
+        self.tiers_path = tiers_path
+        self.tiers = {}
+        self.stats = {TIER_HTTP: 0, TIER_BROWSER: 0, 'fallbacks': 0}
+        self._lock = threading.Lock()
+        if tiers_path and os.path.exists(tiers_path):
+            with open(tiers_path, 'r', encoding='utf-8') as f:
+                # {host: {'tier': ..., 'at': ...}}, older files map host to tier
+                self.tiers = {host: entry if isinstance(entry, dict) else {'tier': entry, 'at': 0}
+                              for host, entry in json.load(f).items()}
+
+    def _use_browser(self, host):
+        entry = self.tiers.get(host)
+        return (entry is not None and entry['tier'] == TIER_BROWSER
+                and time.time() - entry['at'] < BROWSER_TIER_TTL)
+
+    def fetch(self, url):
+        host = urlparse(url).netloc.lower()
+        timings = {}
+        if not self._use_browser(host):
+            html = self._fetch_http(url)
+            if html:
+                start = time.perf_counter()
+                soup = make_soup(html, self.parser)
+                timings['parse'] = time.perf_counter() - start
+                start = time.perf_counter()
+                products = [str(p) for p in find_minimal_product_containers(soup)]
+                timings['detect'] = time.perf_counter() - start
+                if len(products) >= self.min_products:
+                    self._remember(host, TIER_HTTP)
+                    return FetchResult(url, html, TIER_HTTP, products, timings)
+            with self._lock:
+                self.stats['fallbacks'] += 1
+
+        html = self.browser_fetch(url)
+        self._remember(host, TIER_BROWSER)
+        return FetchResult(url, html, TIER_BROWSER, timings=timings)
+
+    def _fetch_http(self, url):
+        try:
+            response = self.http.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            return ''
+        if response.status_code != 200 or 'html' not in response.headers.get('Content-Type', 'text/html'):
+            return ''
+        if 'charset' in response.headers.get('Content-Type', '').lower():
+            return response.text
+        # Without a charset requests would decode as ISO-8859-1; use the
+        # page's <meta> charset or a guess from the bytes, as the parser would
+        return UnicodeDammit(response.content, is_html=True).unicode_markup or ''
+
+    def _remember(self, host, tier):
+        with self._lock:
+            self.stats[tier] += 1
+            entry = self.tiers.get(host)
+            if entry is not None and entry['tier'] == tier and (tier == TIER_HTTP or self._use_browser(host)):
+                return
+            self.tiers[host] = {'tier': tier, 'at': time.time()}
+            if self.tiers_path:
+                with open(self.tiers_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.tiers, f, indent=2, sort_keys=True)
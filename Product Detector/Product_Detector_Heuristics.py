@@ -0,0 +1,213 @@
+import re
+from collections import namedtuple
+from bs4.element import Tag
+
+# Product container heuristics shared by the app and the offline scripts.
+# A product container is a tag whose text contains a price and a unit and
+# which holds at least one <img>; we keep only the minimal ones.
+
+CURRENCY_SYMBOLS = {"$", "€", "£", "¥", "₺"}
+CURRENCY_CODES = {"USD", "EUR", "GBP", "JPY", "TRY", "TL"}
+
+PRICE_REGEX = r"""
+    (?:
+        (?:€|\$|₺|£|¥|TL)\s?[\d]+(?:[.,]\d+)?
+        |
+        [\d]+(?:[.,]\d+)?\s?(?:€|\$|₺|£|¥|TL)
+        |
+        [\d]+(?:[.,]\d+)(?:\s?[^\w\s])?
+    )
+"""
+UNIT_REGEX = r"\b\d+(?:\.\d+)?\s?(?:g|kg|ml|l|pcs|unit|x)?\b"
+
+# Same as UNIT_REGEX, but only for matches whose surrounding characters lie
+# inside the text. Such a match survives any concatenation with sibling text,
+# so once a child has one every ancestor contains a unit as well.
+INNER_UNIT_REGEX = r"(?<=\W)\d+(?:\.\d+)?\s?(?:g|kg|ml|l|pcs|unit|x)?\b(?=[\s\S])"
+
+PRICE_PATTERN = re.compile(PRICE_REGEX, re.VERBOSE | re.IGNORECASE)
+UNIT_PATTERN = re.compile(UNIT_REGEX, re.IGNORECASE)
+INNER_UNIT_PATTERN = re.compile(INNER_UNIT_REGEX, re.IGNORECASE)
+CURRENCY_PATTERN = re.compile(r"€|\$|₺|£|¥|TL", re.IGNORECASE)
+
+PRICE_WORD_SUFFIXES = ['€', '$', '₺', '£', '¥', 'TL']
+WORD_SUFFIX_PATTERN = re.compile(r"[€$₺£¥]|TL")
+DIGIT_PATTERN = re.compile(r"\d")
+
+# get_text() on an ordinary tag only joins strings of exactly these types
+MAIN_STRING_TYPES = Tag.MAIN_CONTENT_STRING_TYPES
+
+# price: matched price text, currency: currency token of that price if any,
+# unit: first unit match, inner_unit: whether an inner unit match exists
+# (only looked for on request), word_price: the price was only found by the
+# loose "number followed by a currency word" rule.
+ScanResult = namedtuple('ScanResult', ['price', 'currency', 'unit', 'inner_unit', 'word_price'])
+# Most texts have neither, they all share this result
+NO_MATCH = ScanResult(None, None, None, False, False)
+
+class ProductTextScanner:
+    # Finds the price, currency and unit of a text. A single pattern with the
+    # price and unit patterns as lookaheads at every digit turned out slower
+    # than two searches done in C, so each pattern runs on its own: the first
+    # hit of each is what re.search returns anyway. The inner unit is only
+    # looked for on request, and only when the text has a unit at all.
+
+    def __init__(self):
+        self.price_pattern = PRICE_PATTERN
+        self.unit_pattern = UNIT_PATTERN
+        self.inner_unit_pattern = INNER_UNIT_PATTERN
+
+    def scan(self, text, want_inner_unit=False):
+        # Price and unit matches never start or end with whitespace, so they
+        # are looked for in the stripped text: get_text() pads snippets with
+        # newlines, and every leading blank is a position the patterns try.
+        # The inner unit depends on the characters around it, not stripped.
+        stripped = text.strip()
+        # Both patterns need a digit, and most texts (labels, names, empty
+        # wrappers) have none; the word price rule below still gets its turn
+        if DIGIT_PATTERN.search(stripped) is None:
+            unit = price = None
+        else:
+            unit = self.unit_pattern.search(stripped)
+            price = self.price_pattern.search(stripped)
+        if unit is not None:
+            unit = unit.group()
+        inner_unit = (want_inner_unit and unit is not None
+                      and self.inner_unit_pattern.search(text) is not None)
+
+        if price is not None:
+            price = price.group()
+            currency = CURRENCY_PATTERN.search(price)
+            return ScanResult(price, currency.group() if currency else None, unit, inner_unit, False)
+
+        # A word price needs one of PRICE_WORD_SUFFIXES, most texts have none
+        if WORD_SUFFIX_PATTERN.search(stripped) is not None:
+            words = stripped.split()
+            for i, word in enumerate(words):
+                if word.replace(",", "").replace(".", "").isdigit():
+                    if i + 1 < len(words) and words[i + 1] in PRICE_WORD_SUFFIXES:
+                        return ScanResult(f"{word} {words[i + 1]}", words[i + 1], unit, inner_unit, True)
+        if unit is None:
+            return NO_MATCH
+        return ScanResult(None, None, unit, inner_unit, False)
+
+SCANNER = ProductTextScanner()
+
+def contains_price_naive(text):
+    # Original two step price check, kept as the reference for the scanner
+    text = text.strip()
+    if PRICE_PATTERN.search(text):
+        return True
+    words = text.split()
+    for i, word in enumerate(words):
+        if word.replace(",", "").replace(".", "").isdigit():
+            if i + 1 < len(words) and words[i + 1] in PRICE_WORD_SUFFIXES:
+                return True
+    return False
+
+def contains_unit_naive(text):
+    return bool(UNIT_PATTERN.search(text))
+
+def contains_price(text):
+    return SCANNER.scan(text).price is not None
+
+def contains_unit(text):
+    return SCANNER.scan(text).unit is not None
+
+def contains_image(element):
+    return element.find("img") is not None
+
+def is_valid_product(element):
+    if not contains_image(element):
+        return False
+    scan = SCANNER.scan(element.get_text().lower())
+    return scan.price is not None and scan.unit is not None
+
+def is_valid_product_naive(element):
+    text_content = element.get_text().lower()
+    has_price = contains_price_naive(text_content)
+    has_unit = contains_unit_naive(text_content)
+    has_image = contains_image(element)
+    return has_price and has_unit and has_image
+
+def find_minimal_product_containers_naive(soup):
+    # Original implementation, kept as the reference for parity checks and
+    # benchmarks. Runs get_text() over every subtree, so it is quadratic.
+    product_candidates = [el for el in soup.find_all(True) if is_valid_product_naive(el)]
+    minimal_products = []
+    for candidate in product_candidates:
+        if not any(is_valid_product_naive(child) for child in candidate.find_all(True, recursive=False)):
+            minimal_products.append(candidate)
+    return minimal_products
+
+def index_tree(soup):
+    # Walk the tree once in document order. Returns the page text (the same
+    # strings get_text() would join), every tag, each tag's parent index and
+    # the [start, end) slice of the page text that belongs to the tag.
+    parts = []
+    tags = []
+    parents = []
+    spans = []
+    length = 0
+    stack = [(iter(soup.contents), -1)]
+    while stack:
+        children, parent = stack[-1]
+        for node in children:
+            if isinstance(node, Tag):
+                index = len(tags)
+                tags.append(node)
+                parents.append(parent)
+                spans.append([length, length])
+                stack.append((iter(node.contents), index))
+                break
+            if type(node) in MAIN_STRING_TYPES:
+                parts.append(node)
+                length += len(node)
+        else:
+            stack.pop()
+            if parent >= 0:
+                spans[parent][1] = length
+    return "".join(parts), tags, parents, spans
+
+def find_minimal_product_containers(soup):
+    # Single pass, bottom-up version of find_minimal_product_containers_naive.
+    # Tags are visited children first and each one inherits image, price and
+    # unit flags from its children, so a tag's text is only scanned when none
+    # of its children already settled the answer. Prices found by the pattern
+    # and inner units stay valid in every ancestor; word prices do not.
+    page_text, tags, parents, spans = index_tree(soup)
+    count = len(tags)
+    has_image = [False] * count
+    price_hit = [False] * count
+    unit_hit = [False] * count
+    valid = [False] * count
+    child_valid = [False] * count
+
+    # Reverse document order always reaches children before their parent
+    for i in range(count - 1, -1, -1):
+        tag = tags[i]
+        if has_image[i]:
+            if tag.interesting_string_types in (None, MAIN_STRING_TYPES):
+                if price_hit[i] and unit_hit[i]:
+                    valid[i] = True
+                else:
+                    scan = SCANNER.scan(page_text[spans[i][0]:spans[i][1]].lower(), want_inner_unit=True)
+                    price_hit[i] = scan.price is not None and not scan.word_price
+                    unit_hit[i] = scan.inner_unit
+                    valid[i] = scan.price is not None and scan.unit is not None
+            else:
+                # <script>, <style>, <template> etc. collect other string types
+                valid[i] = is_valid_product(tag)
+
+        parent = parents[i]
+        if parent >= 0:
+            if has_image[i] or tag.name == "img":
+                has_image[parent] = True
+            if price_hit[i]:
+                price_hit[parent] = True
+            if unit_hit[i]:
+                unit_hit[parent] = True
+            if valid[i]:
+                child_valid[parent] = True
+
+    return [tags[i] for i in range(count) if valid[i] and not child_valid[i]]
@@ -0,0 +1,212 @@
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from sklearn.naive_bayes import MultinomialNB
+
+from Product_Detector_DB import get_database
+from Product_Detector_Features import FEATURE_WORKERS, get_feature_cache
+
+# Incremental training. The TF-IDF vectorizer has to see every document
+# before it can encode any of them, so Product_Detector_Train.py refits
+# everything from the whole train_data table. Here the features come from a
+# stateless HashingVectorizer and the models learn with partial_fit, so an
+# update only reads, parses and learns the rows added since the checkpoint
+# (by train_data.id; the checkpoint also records their created_at).
+#
+# Ids are handed out at insert time but rows only show up at commit, so a
+# save that commits late can appear below ids already read. Every update
+# reads again the last ID_OVERLAP ids before the checkpoint and skips the ones
+# the checkpoint lists as seen.
+#
+#   python Product_Detector_Incremental.py update          # learn the new rows
+#   python Product_Detector_Incremental.py check           # compare with a full retrain
+#   python Product_Detector_Incremental.py status
+#
+# Rows whose id is a multiple of HOLDOUT_EVERY are never learned; check()
+# scores the incremental model and a model retrained from scratch on them.
+# Re-sent labels update their row in place and keep its id (see
+# insert_labels), so a product stays on the same side of the hold-out split.
+# Labels that were changed or deleted after being learned stay learned until
+# the checkpoint is reset.
+
+CHECKPOINT_DIR = './data/incremental'
+HOLDOUT_EVERY = 5
+FETCH_BATCH = 5000
+MINI_BATCH = 500
+ID_OVERLAP = 2000
+
+def make_hashing_vectorizer():
+    # Non-negative counts so MultinomialNB can use them too
+    return HashingVectorizer(n_features=2 ** 18, alternate_sign=False, norm='l2')
+
+INCREMENTAL_MODELS = {
+    'sgd': lambda: SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42),
+    'naive_bayes': lambda: MultinomialNB(alpha=0.01),
+}
+CLASSES = np.array([0, 1])
+
+def hashed_features(vectorizer, page_texts, product_texts):
+    # [page vector | product vector], each distinct page hashed once
+    positions = {}
+    rows = [positions.setdefault(text, len(positions)) for text in page_texts]
+    X_page = vectorizer.transform(list(positions))[rows]
+    return sp.hstack([X_page, vectorizer.transform(product_texts)], format='csr')
+
+def is_holdout(row):
+    return row['id'] % HOLDOUT_EVERY == 0
+
+def checkpoint_path(model_name, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f"{model_name}.pkl")
+
+def load_checkpoint(model_name, checkpoint_dir=CHECKPOINT_DIR):
+    path = checkpoint_path(model_name, checkpoint_dir)
+    if os.path.exists(path):
+        return joblib.load(path)
+    return {'model_name': model_name, 'model': INCREMENTAL_MODELS[model_name](), 'last_id': 0,
+            'last_created_at': None, 'seen_ids': [], 'rows_learned': 0, 'updates': [], 'updated_at': None}
+
+def save_checkpoint(checkpoint, checkpoint_dir=CHECKPOINT_DIR):
+    # Written to a temporary file first so a crash never leaves half a checkpoint
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = checkpoint_path(checkpoint['model_name'], checkpoint_dir)
+    joblib.dump(checkpoint, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def row_features(rows, vectorizer, feature_workers=FEATURE_WORKERS):
+    texts = get_feature_cache().extract_rows(rows, feature_workers, progress=False)
+    page_texts, product_texts = zip(*texts)
+    return hashed_features(vectorizer, page_texts, product_texts), np.array([int(row['label']) for row in rows])
+
+def update(model_name='sgd', checkpoint_dir=CHECKPOINT_DIR, epochs=1, feature_workers=FEATURE_WORKERS):
+    # Learns every row added since the checkpoint; saves after each fetched
+    # batch, so an interrupted update resumes where it stopped
+    checkpoint = load_checkpoint(model_name, checkpoint_dir)
+    model = checkpoint['model']
+    vectorizer = make_hashing_vectorizer()
+    db = get_database()
+    start = time.perf_counter()
+    learned = 0
+    if 'seen_ids' in checkpoint:
+        seen = set(checkpoint['seen_ids'])
+        after = max(0, checkpoint['last_id'] - ID_OVERLAP)
+    else:
+        # Checkpoint from before the overlap, everything up to last_id is seen
+        seen = set()
+        after = checkpoint['last_id']
+    while True:
+        rows = db.fetch_train_data_since(after, FETCH_BATCH)
+        if not rows:
+            break
+        after = rows[-1]['id']
+        rows = [row for row in rows if row['id'] not in seen]
+        train_rows = [row for row in rows if not is_holdout(row)]
+        if train_rows:
+            X, y = row_features(train_rows, vectorizer, feature_workers)
+            # Rows come grouped by page; shuffle so each mini batch is mixed
+            random = np.random.RandomState(checkpoint['last_id'])
+            for _ in range(epochs):
+                order = random.permutation(len(y))
+                for begin in range(0, len(order), MINI_BATCH):
+                    batch = order[begin:begin + MINI_BATCH]
+                    model.partial_fit(X[batch], y[batch], classes=CLASSES)
+            learned += len(train_rows)
+        if rows and rows[-1]['id'] > checkpoint['last_id']:
+            checkpoint['last_id'] = rows[-1]['id']
+            checkpoint['last_created_at'] = rows[-1]['created_at']
+        seen.update(row['id'] for row in rows)
+        seen = {row_id for row_id in seen if row_id > checkpoint['last_id'] - ID_OVERLAP}
+        checkpoint['seen_ids'] = sorted(seen)
+        checkpoint['rows_learned'] += len(train_rows)
+        checkpoint['updated_at'] = time.time()
+        save_checkpoint(checkpoint, checkpoint_dir)
+    elapsed = time.perf_counter() - start
+    if learned:
+        checkpoint['updates'] = checkpoint['updates'][-99:] + [{'at': time.time(), 'rows': learned, 'seconds': elapsed}]
+        save_checkpoint(checkpoint, checkpoint_dir)
+    return checkpoint, learned, elapsed
+
+def scores(y_true, y_pred):
+    precision, recall, f1, _ = precision_recall_fscore_support(y_true, y_pred, average='binary', zero_division=0)
+    return {'accuracy': accuracy_score(y_true, y_pred), 'precision': precision, 'recall': recall, 'f1': f1}
+
+def check(model_name='sgd', checkpoint_dir=CHECKPOINT_DIR, feature_workers=FEATURE_WORKERS):
+    # Scores the incremental model against the same estimator fitted from
+    # scratch on every learned row, both on the held-out rows
+    checkpoint = load_checkpoint(model_name, checkpoint_dir)
+    if not checkpoint['rows_learned']:
+        raise SystemExit("Nothing learned yet, run update first")
+    rows = [row for row in get_database().fetch_train_data_since(0) if row['id'] <= checkpoint['last_id']]
+    train_rows = [row for row in rows if not is_holdout(row)]
+    test_rows = [row for row in rows if is_holdout(row)]
+    if not test_rows:
+        raise SystemExit("No held-out rows to compare on")
+    vectorizer = make_hashing_vectorizer()
+    X_train, y_train = row_features(train_rows, vectorizer, feature_workers)
+    X_test, y_test = row_features(test_rows, vectorizer, feature_workers)
+
+    start = time.perf_counter()
+    full = INCREMENTAL_MODELS[model_name]().fit(X_train, y_train)
+    full_s = time.perf_counter() - start
+
+    incremental_pred = checkpoint['model'].predict(X_test)
+    full_pred = full.predict(X_test)
+    return {
+        'model': model_name,
+        'train_rows': len(train_rows),
+        'test_rows': len(test_rows),
+        'incremental': scores(y_test, incremental_pred),
+        'full': scores(y_test, full_pred),
+        'agreement': float(np.mean(incremental_pred == full_pred)),
+        'full_retrain_s': full_s,
+        'last_update_s': checkpoint['updates'][-1]['seconds'] if checkpoint['updates'] else None,
+    }
+
+def print_check(result):
+    print(f"{result['model']}: {result['train_rows']} learned rows, {result['test_rows']} held out")
+    print(f"{'':<12} {'accuracy':>9} {'precision':>10} {'recall':>8} {'f1':>6}")
+    for name in ('incremental', 'full'):
+        row = result[name]
+        print(f"{name:<12} {row['accuracy']:>9.3f} {row['precision']:>10.3f} {row['recall']:>8.3f} {row['f1']:>6.3f}")
+    print(f"Predictions agree on {result['agreement']:.1%} of the held-out rows")
+    if result['last_update_s'] is not None:
+        print(f"Last incremental update {result['last_update_s']:.2f}s, "
+              f"full retrain fit {result['full_retrain_s']:.2f}s (without feature extraction)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental training with hashed features and partial_fit")
+    parser.add_argument('command', choices=['update', 'check', 'status', 'reset'])
+    parser.add_argument('--model', choices=list(INCREMENTAL_MODELS), default='sgd')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    parser.add_argument('--epochs', type=int, default=1,
+                        help="passes over each batch of new rows; more passes make SGD forget older rows")
+    parser.add_argument('--feature-workers', type=int, default=FEATURE_WORKERS)
+    parser.add_argument('--max-drop', type=float, default=0.02,
+                        help="check fails when the incremental F1 is this much below the full retrain")
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        checkpoint, learned, elapsed = update(args.model, args.checkpoint_dir, args.epochs, args.feature_workers)
+        print(f"Learned {learned} new rows in {elapsed:.2f}s, {checkpoint['rows_learned']} in total, "
+              f"checkpoint at id {checkpoint['last_id']}")
+    elif args.command == 'check':
+        result = check(args.model, args.checkpoint_dir, args.feature_workers)
+        print_check(result)
+        drop = result['full']['f1'] - result['incremental']['f1']
+        if drop > args.max_drop:
+            raise SystemExit(f"Incremental model is {drop:.3f} F1 below a full retrain, reset and update again")
+    elif args.command == 'status':
+        checkpoint = load_checkpoint(args.model, args.checkpoint_dir)
+        print(f"{args.model}: {checkpoint['rows_learned']} rows learned, checkpoint at id {checkpoint['last_id']} "
+              f"(created {checkpoint['last_created_at']}), {len(checkpoint['updates'])} updates")
+    elif args.command == 'reset':
+        path = checkpoint_path(args.model, args.checkpoint_dir)
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"Removed {path}")
@@ -0,0 +1,95 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for the web app. A request submits a job and gets its id
+# back at once; a bounded pool of worker threads runs the jobs and finished
+# jobs are kept for retention_s so the client can poll for the result.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class QueueFullError(Exception):
+    pass
+
+class Job:
+
+    def __init__(self, owner=None):
+        self.id = str(uuid.uuid4())
+        # Whoever may see the job, e.g. the submitting session's id
+        self.owner = owner
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def status(self):
+        status = {'id': self.id, 'state': self.state, 'created_at': self.created_at,
+                  'started_at': self.started_at, 'finished_at': self.finished_at}
+        if self.error is not None:
+            status['error'] = self.error
+        if self.started_at is not None:
+            status['elapsed_s'] = (self.finished_at or time.time()) - self.started_at
+        return status
+
+class JobQueue:
+
+    def __init__(self, workers=2, max_pending=20, retention_s=3600):
+        self.max_pending = max_pending
+        self.retention_s = retention_s
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, owner=None):
+        # Raises QueueFullError instead of queueing work nobody will wait for
+        with self._lock:
+            self._expire()
+            pending = sum(1 for job in self._jobs.values() if job.state in (QUEUED, RUNNING))
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} jobs are already waiting")
+            job = Job(owner)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = func(*args)
+            job.state = DONE
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        cutoff = time.time() - self.retention_s
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
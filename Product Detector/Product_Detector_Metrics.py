@@ -0,0 +1,126 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics in the Prometheus text format, served by the app
+# at /metrics. Counters, gauges and histograms keep one small record per label
+# combination behind a lock, so recording costs a dict lookup and a bisect
+# and can stay on in production.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_metrics = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(key, value) for key, value in items)
+        return '\n'.join(lines)
+
+    def _render_samples(self, key, value):
+        return f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            record = self._values.get(key)
+            if record is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                record = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            record[0][index] += 1
+            record[1] += value
+            record[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self, key, record):
+        counts, total, count = record
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return '\n'.join(lines)
+
+def render_metrics():
+    return '\n'.join(metric.render() for metric in _metrics) + '\n'
+
+# Pipeline metrics shared by the app and the scripts
+STAGE_SECONDS = Histogram('product_detector_stage_seconds',
+                          "Time spent in each pipeline stage", ['stage'])
+FETCH_SECONDS = Histogram('product_detector_fetch_seconds',
+                          "Page fetch time by tier (cache, http, browser)", ['tier'])
+FETCHES = Counter('product_detector_fetches_total', "Page fetches by tier", ['tier'])
+PAGE_BYTES = Histogram('product_detector_page_bytes', "Size of fetched pages", buckets=SIZE_BUCKETS)
+PRODUCTS_PER_PAGE = Histogram('product_detector_products_per_page',
+                              "Product candidates detected per page", buckets=COUNT_BUCKETS)
+JOBS = Counter('product_detector_jobs_total', "Finished fetch jobs by outcome", ['outcome'])
+LABELS_SAVED = Counter('product_detector_labels_saved_total', "Labels written to the database")
+REQUEST_SECONDS = Histogram('product_detector_request_seconds',
+                            "HTTP request latency", ['endpoint', 'method', 'status'])
@@ -0,0 +1,144 @@
+import argparse
+import os
+import threading
+import time
+
+import joblib
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Lazy registry of the trained artifacts. Nothing is loaded until a model is
+# first asked for, and each one is loaded once per process.
+#
+# joblib files are opened with mmap_mode='r', so large numpy arrays (the
+# vectorizer's idf_, linear coefficients) are mapped read-only from the file
+# and shared through the page cache by every process that loads them. Tree
+# ensembles copy their node arrays into sklearn's own Tree objects, so those
+# still take private memory. XGBoost is converted once to the native UBJSON
+# booster format and loaded from that, without unpickling.
+#
+#   python Product_Detector_Models.py            # load everything, print a report
+
+MODEL_DIR = '.'
+NATIVE_DIR = './data/model_cache'
+
+ARTIFACTS = {
+    'vectorizer': 'tfidf_vectorizer.pkl',
+    'random_forest': 'random_forest_product_model.pkl',
+    'adaboost': 'adaboost_product_model.pkl',
+    'linear_svc': 'linear_svc_product_model.pkl',
+    'xgboost': 'xgboost_product_model.pkl',
+}
+MODEL_NAMES = [name for name in ARTIFACTS if name != 'vectorizer']
+NATIVE_FORMATS = {'xgboost': 'ubj'}
+
+class ModelLoadError(Exception):
+    # An artifact that is missing, corrupt or written by an incompatible
+    # library version; whatever the loader raised is its __cause__
+    pass
+
+def resident_bytes():
+    # Current RSS of this process, None where it cannot be read
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def load_xgboost_native(pkl_path, native_dir):
+    from xgboost import XGBClassifier
+    name = os.path.splitext(os.path.basename(pkl_path))[0]
+    native_path = os.path.join(native_dir, f"{name}.{NATIVE_FORMATS['xgboost']}")
+    if not os.path.exists(native_path) or os.path.getmtime(native_path) < os.path.getmtime(pkl_path):
+        os.makedirs(native_dir, exist_ok=True)
+        joblib.load(pkl_path).save_model(native_path)
+    model = XGBClassifier()
+    model.load_model(native_path)
+    return model, native_path
+
+class ModelRegistry:
+
+    def __init__(self, model_dir=MODEL_DIR, native_dir=NATIVE_DIR, mmap=True):
+        self.model_dir = model_dir
+        self.native_dir = native_dir
+        self.mmap = mmap
+        self._loaded = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        if name not in ARTIFACTS:
+            raise ValueError(f"Unknown model: {name}")
+        return os.path.join(self.model_dir, ARTIFACTS[name])
+
+    def get(self, name):
+        path = self.path(name)
+        with self._lock:
+            if name not in self._loaded:
+                try:
+                    self._loaded[name] = self._load(name, path)
+                except Exception as e:
+                    # Unpickling can fail with almost any exception type
+                    raise ModelLoadError(f"Cannot load {name} from {path}: {e}") from e
+            return self._loaded[name]
+
+    def _load(self, name, path):
+        rss_before = resident_bytes()
+        start = time.perf_counter()
+        source = path
+        if name in NATIVE_FORMATS:
+            artifact, source = load_xgboost_native(path, self.native_dir)
+        else:
+            artifact = joblib.load(path, mmap_mode='r' if self.mmap else None)
+        load_s = time.perf_counter() - start
+        rss_after = resident_bytes()
+        self._stats[name] = {
+            'name': name,
+            'source': source,
+            'file_bytes': os.path.getsize(source),
+            'load_s': load_s,
+            # Includes imports done by the first load of each library
+            'resident_bytes': rss_after - rss_before if rss_before is not None else None,
+            'mmap': self.mmap and name not in NATIVE_FORMATS,
+        }
+        return artifact
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    def stats(self):
+        with self._lock:
+            return [dict(self._stats[name]) for name in ARTIFACTS if name in self._stats]
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+def get_registry():
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = ModelRegistry()
+        return _shared_registry
+
+def print_stats(stats):
+    print(f"{'model':<15} {'file KB':>8} {'load s':>8} {'RSS KB':>8} {'mmap':>5}")
+    for row in stats:
+        resident = row['resident_bytes'] // 1024 if row['resident_bytes'] is not None else '-'
+        print(f"{row['name']:<15} {row['file_bytes'] // 1024:>8} {row['load_s']:>8.3f} {resident:>8} "
+              f"{'yes' if row['mmap'] else 'no':>5}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the trained models and report load time and memory")
+    parser.add_argument('models', nargs='*', default=list(ARTIFACTS), help="artifacts to load, default all")
+    parser.add_argument('--no-mmap', action='store_true')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(mmap=not args.no_mmap)
+    for name in args.models:
+        registry.get(name)
+    print_stats(registry.stats())
@@ -0,0 +1,123 @@
+import argparse
+import glob
+import os
+import tracemalloc
+
+from Product_Detector_Heuristics import find_minimal_product_containers
+from Product_Detector_Parser import available_backends, extract_text_from_html, make_soup
+from Product_Detector_Streaming import SPOOL_MIN_NODES, StreamingDetector, iter_file_chunks
+
+# Checks that every available parser backend gives the same results as
+# html.parser on the committed corpus: the same product containers (text and
+# images, in page order) and the same extracted training text for pages and
+# product snippets. Backends may still serialize markup differently, e.g.
+# lxml does not treat <source> as a void element; markup differences are
+# reported, and are why html.parser stays the default backend. The streaming
+# detector is checked against the lxml backend, which parses with the same
+# libxml2 parser, and must keep its tree small:
+# at most STREAM_PEAK_NODES nodes in memory at once, whatever the page size.
+# The Python-side peak (tracemalloc; libxml2's own nodes are not traced, hence
+# the node count) is reported next to the page size.
+
+STREAM_PEAK_NODES = 4 * SPOOL_MIN_NODES
+
+REFERENCE_BACKEND = 'html.parser'
+
+def read_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def container_signature(tag):
+    images = tuple(img.get('src') for img in tag.find_all('img'))
+    return tag.get_text(), images
+
+def detect(html, backend):
+    products = find_minimal_product_containers(make_soup(html, backend))
+    return [container_signature(p) for p in products], [str(p) for p in products]
+
+def check_pages(paths, backend):
+    failures = []
+    markup_differences = 0
+    for path in paths:
+        html = read_file(path)
+        name = os.path.basename(path)
+        expected, expected_markup = detect(html, REFERENCE_BACKEND)
+        actual, actual_markup = detect(html, backend)
+        if expected != actual:
+            failures.append(f"{name}: containers differ ({len(expected)} vs {len(actual)})")
+        elif expected_markup != actual_markup:
+            markup_differences += 1
+        if extract_text_from_html(html, REFERENCE_BACKEND) != extract_text_from_html(html, backend):
+            failures.append(f"{name}: extracted page text differs")
+    return failures, markup_differences
+
+def stream_with_peaks(path):
+    # Streamed products plus the peak tree size and traced Python memory
+    detector = StreamingDetector()
+    tracemalloc.start()
+    try:
+        products = []
+        for chunk in iter_file_chunks(path):
+            products.extend(detector.feed(chunk))
+        products.extend(detector.close())
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return products, detector.peak_nodes, peak_bytes
+
+def check_streaming(paths):
+    failures = []
+    peaks = []
+    for path in paths:
+        name = os.path.basename(path)
+        expected, _ = detect(read_file(path), 'lxml')
+        products, peak_nodes, peak_bytes = stream_with_peaks(path)
+        actual = [(p.text, tuple(p.images)) for p in products]
+        if expected != actual:
+            failures.append(f"{name}: streamed containers differ ({len(expected)} vs {len(actual)})")
+        if peak_nodes > STREAM_PEAK_NODES:
+            failures.append(f"{name}: streaming kept {peak_nodes} nodes, more than {STREAM_PEAK_NODES}")
+        peaks.append((os.path.getsize(path), peak_nodes, peak_bytes))
+    return failures, peaks
+
+def check_products(paths, backend):
+    failures = []
+    for path in paths:
+        html = read_file(path)
+        if extract_text_from_html(html, REFERENCE_BACKEND) != extract_text_from_html(html, backend):
+            failures.append(f"{os.path.basename(path)}: extracted product text differs")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check parser backends against html.parser")
+    parser.add_argument('--pages', default='./data/pages')
+    parser.add_argument('--products', default='./data/products')
+    args = parser.parse_args()
+
+    pages = sorted(glob.glob(os.path.join(args.pages, '*.html')))
+    products = sorted(glob.glob(os.path.join(args.products, '*.html')))
+    failed = False
+    for backend in available_backends():
+        if backend == REFERENCE_BACKEND:
+            continue
+        page_failures, markup_differences = check_pages(pages, backend)
+        product_failures = check_products(products, backend)
+        failures = page_failures + product_failures
+        print(f"{backend}: {len(pages)} pages, {len(products)} products, {len(failures)} failures, "
+              f"{markup_differences} pages with different container markup")
+        for failure in failures:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+
+    if 'lxml' in available_backends():
+        failures, peaks = check_streaming(pages)
+        page_bytes, peak_nodes, peak_bytes = max(peaks, key=lambda peak: peak[2])
+        print(f"streaming: {len(pages)} pages, {len(failures)} failures, at most "
+              f"{max(peak[1] for peak in peaks)} nodes in memory; largest Python peak "
+              f"{peak_bytes // 1024} KB on a {page_bytes // 1024} KB page")
+        for failure in failures:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+
+    if failed:
+        raise SystemExit("Parser backends disagree")
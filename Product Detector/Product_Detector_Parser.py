@@ -0,0 +1,50 @@
+import os
+from bs4 import BeautifulSoup
+
+# HTML parser backend shared by the app, the test scripts and the training
+# scripts. html.parser stays the default: lxml parses the saved pages in
+# about half the time and finds the same product containers on data/pages,
+# but it serializes some of them differently (see Product_Detector_Parity.py),
+# which would change the stored snippets and the training inputs. Set
+# PRODUCT_DETECTOR_PARSER=lxml to opt in.
+
+PARSER_BACKENDS = ('lxml', 'html.parser')
+
+def available_backends():
+    backends = []
+    for backend in PARSER_BACKENDS:
+        if backend == 'lxml':
+            try:
+                import lxml  # noqa: F401
+            except ImportError:
+                continue
+        backends.append(backend)
+    return backends
+
+def default_backend():
+    configured = os.environ.get('PRODUCT_DETECTOR_PARSER')
+    if configured:
+        if configured not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown parser backend: {configured}")
+        if configured not in available_backends():
+            raise ValueError(f"Parser backend {configured} is not installed")
+        return configured
+    return 'html.parser'
+
+DEFAULT_BACKEND = default_backend()
+
+def make_soup(html, backend=None):
+    return BeautifulSoup(html, backend or DEFAULT_BACKEND)
+
+TEXT_TAGS = ['h1', 'h2', 'p', 'span', 'a']
+
+def extract_text_from_tag(tag):
+    # Training text of an already parsed element. Matches
+    # extract_text_from_html(str(tag)), where the element itself is found too.
+    elements = tag.find_all(TEXT_TAGS)
+    if tag.name in TEXT_TAGS:
+        elements.insert(0, tag)
+    return " ".join([element.get_text() for element in elements])
+
+def extract_text_from_html(html, backend=None):
+    return extract_text_from_tag(make_soup(html, backend))
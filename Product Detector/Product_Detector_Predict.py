@@ -0,0 +1,195 @@
+import time
+import weakref
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.special import expit
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+from Product_Detector_Heuristics import find_minimal_product_containers
+from Product_Detector_Models import MODEL_NAMES, get_registry
+from Product_Detector_Parser import extract_text_from_tag, make_soup
+
+# In-process inference with the trained models. The vectorizer and the model
+# come from the model registry, loaded on first use (or up front with warm())
+# and then kept; all candidate containers of a page are vectorized and
+# classified as one sparse matrix, with the same features as training: page
+# text and product text, side by side.
+#
+# The page half is the same for every candidate, so it is not copied into each
+# row. For linear models it adds the same amount to every decision, which is
+# computed once per page. In a random forest every split on a page column goes
+# the same way for all candidates, so those splits are resolved once per page
+# and the candidates only walk the product splits. Other tree models only look
+# at the columns they split on, so each candidate row carries just the page
+# columns the model actually uses, and those rows share one set of values.
+
+# Per model: (coef, intercept) for linear models, the flattened trees of a
+# forest, else the split columns
+_model_plans = weakref.WeakKeyDictionary()
+
+def split_features(model):
+    # Sorted indices of the columns a tree model splits on
+    if hasattr(model, 'get_booster'):
+        used = model.get_booster().get_score(importance_type='weight')
+        return np.array(sorted(int(name[1:]) for name in used), dtype=np.intp)
+    trees = getattr(model, 'estimators_', [model])
+    features = np.concatenate([tree.tree_.feature for tree in trees])
+    return np.unique(features[features >= 0])
+
+def forest_nodes(model):
+    # All trees of a forest in one set of node arrays. Leaves point to
+    # themselves and compare against +inf, so walking past them is harmless
+    feature, threshold, left, right, proba, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count) + offset
+        leaf = tree.children_left < 0
+        roots.append(offset)
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, np.inf, tree.threshold))
+        left.append(np.where(leaf, nodes, tree.children_left + offset))
+        right.append(np.where(leaf, nodes, tree.children_right + offset))
+        value = tree.value[:, 0, :]
+        proba.append(value / value.sum(axis=1, keepdims=True))
+        offset += tree.node_count
+    return {'feature': np.concatenate(feature).astype(np.intp), 'threshold': np.concatenate(threshold),
+            'left': np.concatenate(left).astype(np.intp), 'right': np.concatenate(right).astype(np.intp),
+            'proba': np.concatenate(proba), 'roots': np.array(roots, dtype=np.intp),
+            'depth': max(estimator.tree_.max_depth for estimator in model.estimators_)}
+
+def model_plan(model):
+    plan = _model_plans.get(model)
+    if plan is None:
+        coef = getattr(model, 'coef_', None)
+        if coef is not None and np.asarray(coef).shape[0] == 1:
+            plan = ('linear', np.asarray(coef).ravel(), float(np.asarray(model.intercept_).ravel()[0]))
+        elif isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            plan = ('forest', forest_nodes(model))
+        else:
+            plan = ('columns', split_features(model))
+        _model_plans[model] = plan
+    return plan
+
+def repeat_row(row, n):
+    # n rows sharing the values of a 1-row CSR matrix, built in one go
+    row = row.tocsr()
+    return sp.csr_matrix((np.tile(row.data, n), np.tile(row.indices, n), np.arange(n + 1) * row.nnz),
+                         shape=(n, row.shape[1]))
+
+def page_product_matrix(model, X_page, X_product):
+    # [page | product] rows with the page part cut down to the columns the
+    # model splits on; the other page columns never change a prediction
+    used = model_plan(model)[1]
+    X_page = X_page.tocsr()
+    keep = np.isin(X_page.indices, used)
+    X_page_used = sp.csr_matrix((X_page.data[keep], X_page.indices[keep], [0, int(keep.sum())]),
+                                shape=X_page.shape)
+    return sp.hstack([repeat_row(X_page_used, X_product.shape[0]), X_product], format='csr')
+
+def forest_proba(nodes, X_page, X_product):
+    # Class probabilities of a forest for the products of one page, as
+    # predict_proba on the [page | product] rows. Trees see float32 features
+    n_page = X_page.shape[1]
+    feature, threshold = nodes['feature'], nodes['threshold']
+    page = X_page.toarray().ravel().astype(np.float32)
+
+    # Splits on page columns: both children become the branch this page takes
+    left, right = nodes['left'].copy(), nodes['right'].copy()
+    on_page = np.flatnonzero(feature < n_page)
+    taken = np.where(page[feature[on_page]] <= threshold[on_page], left[on_page], right[on_page])
+    left[on_page] = right[on_page] = taken
+
+    # Product splits read a dense copy of just the product columns used
+    on_product = feature >= n_page
+    columns = np.unique(feature[on_product] - n_page)
+    X = X_product.tocsc()[:, columns].toarray().astype(np.float32) if len(columns) else \
+        np.zeros((X_product.shape[0], 1), dtype=np.float32)
+    column = np.zeros(len(feature), dtype=np.intp)
+    column[on_product] = np.searchsorted(columns, feature[on_product] - n_page)
+
+    rows = np.arange(X.shape[0])[:, None]
+    node = np.tile(nodes['roots'], (X.shape[0], 1))
+    for _ in range(nodes['depth']):
+        step = np.where(X[rows, column[node]] <= threshold[node], left[node], right[node])
+        if np.array_equal(step, node):
+            break
+        node = step
+    return nodes['proba'][node].mean(axis=1)
+
+def predict_page(model, X_page, X_product):
+    # (labels, scores) for the products of one page, X_page is the 1-row page
+    # vector. Scores are probabilities where the model has them, otherwise
+    # decision values
+    plan = model_plan(model)
+    if plan[0] == 'linear':
+        _, coef, intercept = plan
+        n_page = X_page.shape[1]
+        offset = float((X_page @ coef[:n_page])[0]) + intercept
+        decision = X_product @ coef[n_page:] + offset
+        labels = model.classes_[(decision > 0).astype(int)]
+        return labels, expit(decision) if hasattr(model, 'predict_proba') else decision
+    if plan[0] == 'forest':
+        proba = forest_proba(plan[1], X_page, X_product)
+        return model.classes_[proba.argmax(axis=1)], proba[:, 1]
+    X = page_product_matrix(model, X_page, X_product)
+    if hasattr(model, 'predict_proba'):
+        return model.predict(X), model.predict_proba(X)[:, 1]
+    return model.predict(X), model.decision_function(X)
+
+class Predictor:
+
+    def __init__(self, model_name='random_forest', registry=None):
+        if model_name not in MODEL_NAMES:
+            raise ValueError(f"Unknown model: {model_name}")
+        self.model_name = model_name
+        self.registry = registry or get_registry()
+
+    @property
+    def vectorizer(self):
+        return self.registry.get('vectorizer')
+
+    @property
+    def model(self):
+        return self.registry.get(self.model_name)
+
+    def warm(self):
+        # Loads both artifacts now, returns the seconds it took
+        start = time.perf_counter()
+        self.vectorizer
+        self.model
+        return time.perf_counter() - start
+
+    def features(self, page_text, product_texts):
+        # One row per product: [page vector | product vector], the full
+        # matrix as in training
+        X_page = self.vectorizer.transform([page_text])
+        X_product = self.vectorizer.transform(product_texts)
+        X_page_rows = X_page[np.zeros(len(product_texts), dtype=np.intp)]
+        return sp.hstack([X_page_rows, X_product], format='csr')
+
+    def predict_texts(self, page_text, product_texts):
+        # Returns (labels, scores) for a batch of product texts of one page
+        if not product_texts:
+            return [], []
+        labels, scores = predict_page(self.model, self.vectorizer.transform([page_text]),
+                                      self.vectorizer.transform(product_texts))
+        return labels.tolist(), scores.tolist()
+
+    def predict_html(self, html, parser=None):
+        # Classifies the candidate containers of a page
+        timings = {}
+        start = time.perf_counter()
+        soup = make_soup(html, parser)
+        candidates = find_minimal_product_containers(soup)
+        timings['detect_s'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        labels, scores = self.predict_texts(extract_text_from_tag(soup),
+                                            [extract_text_from_tag(tag) for tag in candidates])
+        timings['predict_s'] = time.perf_counter() - start
+
+        products = [{'index': i + 1, 'label': int(label), 'score': float(score), 'html': str(tag)}
+                    for i, (tag, label, score) in enumerate(zip(candidates, labels, scores))]
+        return products, timings
@@ -0,0 +1,77 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Opt-in cProfile captures. A profiled run writes <id>.prof (load it with
+# pstats or snakeviz) and <id>.json with what was profiled, the URL or page
+# and how long it took. The app profiles requests on demand or by sampling
+# (see PROFILE_TOKEN and PROFILE_SAMPLE_RATE), the batch script with
+# --profile.
+
+PROFILE_DIR = './data/profiles'
+# Orders profile_report accepts; pstats also takes abbreviations and several
+# keys, which a query string should not reach
+SORT_KEYS = sorted(key.value for key in pstats.SortKey)
+
+# Only one capture at a time: concurrent profilers would distort each other
+_active = threading.Lock()
+
+def should_profile(requested=False, sample_rate=0.0):
+    return requested or (sample_rate > 0 and random.random() < sample_rate)
+
+@contextmanager
+def profiled(name, enabled=True, profile_dir=PROFILE_DIR, **meta):
+    # Yields a dict the caller can add details to (e.g. page_bytes) while
+    # the profiled code runs. Does nothing when disabled or when another
+    # capture is running.
+    if not enabled or not _active.acquire(blocking=False):
+        yield meta
+        return
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        profile.enable()
+        try:
+            yield meta
+        finally:
+            profile.disable()
+            save_profile(profile, name, time.perf_counter() - start, profile_dir, meta)
+    finally:
+        _active.release()
+
+def save_profile(profile, name, elapsed_s, profile_dir, meta):
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{uuid.uuid4().hex[:8]}"
+    profile.dump_stats(os.path.join(profile_dir, f"{profile_id}.prof"))
+    info = dict(meta, id=profile_id, name=name, elapsed_s=elapsed_s, created_at=time.time())
+    with open(os.path.join(profile_dir, f"{profile_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2, default=str)
+    return profile_id
+
+def list_profiles(profile_dir=PROFILE_DIR, limit=50):
+    # Slowest captures first
+    profiles = []
+    if os.path.isdir(profile_dir):
+        for file_name in os.listdir(profile_dir):
+            if file_name.endswith('.json'):
+                with open(os.path.join(profile_dir, file_name), 'r', encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+    profiles.sort(key=lambda info: info['elapsed_s'], reverse=True)
+    return profiles[:limit]
+
+def profile_report(profile_id, profile_dir=PROFILE_DIR, sort='cumulative', limit=40):
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort: {sort}")
+    path = os.path.join(profile_dir, f"{os.path.basename(profile_id)}.prof")
+    if not os.path.exists(path):
+        return None
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,152 @@
+import csv
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+# Adaptive page readiness for Selenium fetches. Instead of fixed sleeps we
+# poll the page until the DOM stops mutating and no new network requests
+# finish, then scroll until a scroll brings in no new product-like nodes. A
+# deadline caps the whole thing, and scrolling has its own smaller budget so
+# an endless feed does not use up the deadline. Each step records how long it
+# waited so the settings can be tuned per site (see READINESS_OVERRIDES).
+
+# Installs a MutationObserver once per document and reports the page state
+STATE_JS = """
+if (!window.__pdMutations) {
+    window.__pdMutations = {last: performance.now()};
+    new MutationObserver(function () { window.__pdMutations.last = performance.now(); })
+        .observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+return {
+    ready: document.readyState,
+    quiet_ms: performance.now() - window.__pdMutations.last,
+    resources: performance.getEntriesByType('resource').length,
+    offset: window.pageYOffset,
+    bottom: window.innerHeight + window.pageYOffset >= document.documentElement.scrollHeight - 2
+};
+"""
+
+# Text nodes that look like a price, a cheap in-browser stand-in for
+# find_minimal_product_containers
+PRODUCT_COUNT_JS = """
+var pattern = /(?:€|\\$|₺|£|¥|TL)\\s?\\d|\\d(?:[.,]\\d+)?\\s?(?:€|\\$|₺|£|¥|TL)/i;
+var walker = document.createTreeWalker(document.body || document, NodeFilter.SHOW_TEXT);
+var count = 0;
+while (walker.nextNode()) {
+    if (pattern.test(walker.currentNode.nodeValue)) count++;
+}
+return count;
+"""
+
+DEFAULT_READINESS = {
+    'deadline_s': 30.0,          # overall budget for load and scrolling
+    'poll_s': 0.1,
+    'dom_quiet_ms': 500,         # no DOM mutations for this long
+    'network_quiet_ms': 500,     # no new finished requests for this long
+    'scroll': True,
+    'scroll_quiet_ms': 300,      # shorter settle time after each scroll
+    'max_scrolls': 40,
+    'scroll_budget_s': 15.0,     # total time spent scrolling
+    'idle_scrolls': 2,           # stop after this many scrolls without new products
+}
+
+# Per-host tweaks on top of DEFAULT_READINESS, e.g. {'www.a101.com.tr': {'scroll': False}}
+READINESS_OVERRIDES = {}
+
+def readiness_for(url, **overrides):
+    settings = dict(DEFAULT_READINESS)
+    settings.update(READINESS_OVERRIDES.get(urlparse(url).netloc, {}))
+    settings.update(overrides)
+    return settings
+
+class ReadinessReport:
+
+    def __init__(self, url):
+        self.url = url
+        self.steps = []
+        self.started = time.perf_counter()
+
+    def add(self, step, waited_s, outcome, **details):
+        self.steps.append(dict(step=step, waited_s=waited_s, outcome=outcome, **details))
+
+    @property
+    def total_s(self):
+        return time.perf_counter() - self.started
+
+def wait_until_settled(driver, dom_quiet_ms, network_quiet_ms, deadline, poll_s):
+    # Returns 'settled' or 'deadline'
+    last_resources = None
+    resources_changed = time.perf_counter()
+    while True:
+        state = driver.execute_script(STATE_JS)
+        now = time.perf_counter()
+        if state['resources'] != last_resources:
+            last_resources = state['resources']
+            resources_changed = now
+        if (state['ready'] == 'complete'
+                and state['quiet_ms'] >= dom_quiet_ms
+                and (now - resources_changed) * 1000 >= network_quiet_ms):
+            return 'settled'
+        if now >= deadline:
+            return 'deadline'
+        time.sleep(poll_s)
+
+def wait_for_page(driver, url, settings=None):
+    # Call right after driver.get(url). Returns a ReadinessReport.
+    settings = settings or readiness_for(url)
+    report = ReadinessReport(url)
+    deadline = report.started + settings['deadline_s']
+
+    start = time.perf_counter()
+    outcome = wait_until_settled(driver, settings['dom_quiet_ms'], settings['network_quiet_ms'],
+                                 deadline, settings['poll_s'])
+    report.add('load', time.perf_counter() - start, outcome)
+    if not settings['scroll'] or outcome == 'deadline':
+        return report
+
+    products = driver.execute_script(PRODUCT_COUNT_JS)
+    idle = 0
+    scroll_deadline = min(deadline, time.perf_counter() + settings['scroll_budget_s'])
+    for i in range(settings['max_scrolls']):
+        if time.perf_counter() >= scroll_deadline:
+            report.add('scroll_budget', 0.0, 'budget', products=products)
+            break
+        start = time.perf_counter()
+        driver.execute_script("window.scrollBy(0, window.innerHeight);")
+        outcome = wait_until_settled(driver, settings['scroll_quiet_ms'], settings['scroll_quiet_ms'],
+                                     scroll_deadline, settings['poll_s'])
+        count = driver.execute_script(PRODUCT_COUNT_JS)
+        state = driver.execute_script(STATE_JS)
+        report.add(f'scroll_{i + 1}', time.perf_counter() - start, outcome, products=count)
+        if outcome == 'deadline':
+            break
+        if count > products:
+            products = count
+            idle = 0
+        elif state['bottom']:
+            idle += 1
+            if idle >= settings['idle_scrolls']:
+                break
+    return report
+
+# Browser pool workers log from several threads; rows of one report must not
+# interleave with another's and the header must be written once
+_log_lock = threading.Lock()
+
+def log_report(report, path):
+    # Appends one row per step to a CSV, for tuning READINESS_OVERRIDES
+    with _log_lock:
+        _append_report(report, path)
+
+def _append_report(report, path):
+    new_file = not os.path.exists(path)
+    host = urlparse(report.url).netloc
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['host', 'url', 'step', 'waited_s', 'outcome', 'products', 'total_s'])
+        total = report.total_s
+        for step in report.steps:
+            writer.writerow([host, report.url, step['step'], f"{step['waited_s']:.3f}", step['outcome'],
+                             step.get('products', ''), f"{total:.3f}"])
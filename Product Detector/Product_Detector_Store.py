@@ -0,0 +1,364 @@
+import argparse
+import glob
+import mmap
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Packed storage for product snippets. Instead of one small file per product,
+# snippets are appended to a single pack file and addressed by a reference
+#
+#   ./data/products.pack#<offset>:<length>
+#
+# which is what ends up in train_data.product_path. A sidecar index
+# (<pack>.idx, one "name<TAB>offset<TAB>length" line per snippet) maps the old
+# file names to their place in the pack, so rows that still hold a
+# data/products path resolve after migrating with
+#
+#   python Product_Detector_Store.py migrate ./data/products
+#
+# Appends take an OS-level lock on <pack>.lock, so the app's workers, the
+# batch CLI (--pack) and the crawler (<output>/products.pack) can share a
+# pack. Check it with
+#
+#   python Product_Detector_Store.py check
+
+DEFAULT_PACK = './data/products.pack'
+DEFAULT_PRODUCTS_DIR = './data/products'
+DEFAULT_FETCH_INDEX = './data/fetch_index.sqlite3'
+PACK_REF_SEP = '#'
+SPOOL_BYTES = 4 * 1024 * 1024
+
+def make_ref(pack_path, offset, length):
+    return f"{pack_path}{PACK_REF_SEP}{offset}:{length}"
+
+def parse_ref(ref):
+    # Returns (pack_path, offset, length), or None for a plain file path
+    pack_path, sep, span = ref.rpartition(PACK_REF_SEP)
+    if not sep or ':' not in span:
+        return None
+    offset, _, length = span.partition(':')
+    if not (offset.isdigit() and length.isdigit()):
+        return None
+    return pack_path, int(offset), int(length)
+
+def file_name(path):
+    # Stored paths may come from Windows
+    return path.replace('\\', '/').rsplit('/', 1)[-1]
+
+@contextmanager
+def file_lock(path):
+    # Exclusive lock between processes, held for the duration of the block
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about 10 seconds
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class SegmentPack:
+
+    def __init__(self, path=DEFAULT_PACK):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        self._map = None
+        self._mapped_size = 0
+        self._names = None
+        self._index_size = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, named_snippets):
+        # Snippets are spooled first (in memory up to SPOOL_BYTES, then to a
+        # temporary file), so a generator is consumed without holding the lock
+        # and without keeping every snippet in memory. The spool is then
+        # copied to the end of the pack and the references are returned.
+        entries = []
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+            for name, snippet in named_snippets:
+                data = snippet.encode('utf-8')
+                spool.write(data)
+                entries.append((name, size, len(data)))
+                size += len(data)
+            spool.seek(0)
+            with self._lock, file_lock(self.lock_path):
+                with open(self.path, 'ab') as f:
+                    # The end of the pack is only read once no other process can move it
+                    base = f.seek(0, os.SEEK_END)
+                    shutil.copyfileobj(spool, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                entries = [(name, base + offset, length) for name, offset, length in entries]
+                # Index entries are written once the data they point at is on disk
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.writelines(f"{name}\t{offset}\t{length}\n" for name, offset, length in entries)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if self._names is not None:
+                    self._names.update((name, (offset, length)) for name, offset, length in entries)
+        return [make_ref(self.path, offset, length) for _, offset, length in entries]
+
+    def read_bytes(self, offset, length):
+        # Maps the pack, remapping when it has grown past the current map. The
+        # bytes are copied out while the lock is held, because a later remap
+        # or close() invalidates the map.
+        if not length:
+            return b''
+        end = offset + length
+        with self._lock:
+            if self._map is None or end > self._mapped_size:
+                if self._map is not None:
+                    self._map.close()
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mapped_size = len(self._map)
+            return self._map[offset:end]
+
+    def read(self, offset, length):
+        return str(self.read_bytes(offset, length), 'utf-8')
+
+    def lookup(self, name):
+        # (offset, length) of a migrated file, or None. The index is read
+        # again when the name is unknown and another process has appended
+        with self._lock:
+            index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+            if self._names is None or (name not in self._names and index_size != self._index_size):
+                self._names = {}
+                self._index_size = index_size
+                if index_size:
+                    with open(self.index_path, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            entry_name, offset, length = line.rstrip('\n').split('\t')
+                            self._names[entry_name] = (int(offset), int(length))
+            return self._names.get(name)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+_packs = {}
+_packs_lock = threading.Lock()
+
+def get_pack(path=DEFAULT_PACK):
+    with _packs_lock:
+        pack = _packs.get(path)
+        if pack is None:
+            pack = _packs[path] = SegmentPack(path)
+        return pack
+
+class FetchIndex:
+    # Per-fetch metadata keyed by session_id (url, page path, product
+    # references), kept server side so the Flask session only holds the id.
+    # Products are stored one row each, so a page of them is one range query.
+
+    def __init__(self, path=DEFAULT_FETCH_INDEX):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS fetches (
+                    session_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    page_path TEXT NOT NULL,
+                    products_count INTEGER NOT NULL,
+                    finished INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS fetch_products (
+                    session_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    product_path TEXT NOT NULL,
+                    PRIMARY KEY (session_id, position)
+                );
+            """)
+
+    def _connect(self):
+        # One connection per thread; job workers and request threads share the file
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def put(self, session_id, url, page_path, product_paths):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO fetches (session_id, url, page_path, products_count, created_at) "
+                         "VALUES (?, ?, ?, ?, ?)", (session_id, url, page_path, len(product_paths), time.time()))
+            conn.execute("DELETE FROM fetch_products WHERE session_id = ?", (session_id,))
+            conn.executemany("INSERT INTO fetch_products (session_id, position, product_path) VALUES (?, ?, ?)",
+                             [(session_id, i + 1, path) for i, path in enumerate(product_paths)])
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT url, page_path, products_count, finished, created_at FROM fetches WHERE session_id = ?",
+            (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {'session_id': session_id, 'url': row[0], 'page_path': row[1], 'products_count': row[2],
+                'finished': bool(row[3]), 'created_at': row[4]}
+
+    def product_paths(self, session_id, positions):
+        # {position: product_path} for the given 1-based positions
+        positions = list(positions)
+        if not positions:
+            return {}
+        rows = self._connect().execute(
+            "SELECT position, product_path FROM fetch_products "
+            "WHERE session_id = ? AND position BETWEEN ? AND ?",
+            (session_id, min(positions), max(positions))).fetchall()
+        wanted = set(positions)
+        return {position: path for position, path in rows if position in wanted}
+
+    def finish(self, session_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE fetches SET finished = 1 WHERE session_id = ?", (session_id,))
+
+    def expire(self, max_age_s):
+        # Drops fetches older than max_age_s; the pack itself is append-only
+        cutoff = time.time() - max_age_s
+        with self._connect() as conn:
+            conn.execute("DELETE FROM fetch_products WHERE session_id IN "
+                         "(SELECT session_id FROM fetches WHERE created_at < ?)", (cutoff,))
+            return conn.execute("DELETE FROM fetches WHERE created_at < ?", (cutoff,)).rowcount
+
+def read_product(product_path, products_dir=DEFAULT_PRODUCTS_DIR, pack_path=DEFAULT_PACK):
+    # Reads a snippet from a pack reference or from a legacy data/products
+    # path, falling back to the pack index for files that were migrated
+    ref = parse_ref(product_path)
+    if ref is not None:
+        path, offset, length = ref
+        if not os.path.exists(path):
+            path = os.path.join(os.path.dirname(pack_path), file_name(path))
+        return get_pack(path).read(offset, length)
+
+    name = file_name(product_path)
+    legacy_path = os.path.join(products_dir, name)
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    if os.path.exists(pack_path):
+        pack = get_pack(pack_path)
+        entry = pack.lookup(name)
+        if entry is not None:
+            return pack.read(*entry)
+    print(f"File not found: {product_path}")
+    return ""
+
+def migrate(products_dir, pack_path, batch_size=500):
+    pack = get_pack(pack_path)
+    paths = sorted(glob.glob(os.path.join(products_dir, '*.html')))
+    todo = [path for path in paths if pack.lookup(os.path.basename(path)) is None]
+    for start in range(0, len(todo), batch_size):
+        batch = []
+        for path in todo[start:start + batch_size]:
+            with open(path, 'r', encoding='utf-8') as f:
+                batch.append((os.path.basename(path), f.read()))
+        pack.append(batch)
+
+    # Check every file against its packed copy before anything is deleted;
+    # only the returned, verified paths may be removed
+    verified = []
+    mismatches = 0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() != pack.read(*pack.lookup(os.path.basename(path))):
+                mismatches += 1
+            else:
+                verified.append(path)
+    return verified, len(todo), mismatches
+
+def _append_worker(pack_path, worker, batches, per_batch):
+    pack = SegmentPack(pack_path)
+    refs = []
+    for batch in range(batches):
+        snippets = [(f"w{worker}_{batch}_{i}.html", f"<div>worker {worker} batch {batch} item {i} " + 'x' * (i * 37))
+                    for i in range(per_batch)]
+        refs.extend(zip([text for _, text in snippets], pack.append(snippets)))
+    return refs
+
+def check_concurrent_appends(processes=2, batches=50, per_batch=20):
+    # Appends from several processes at once into a fresh pack, then reads
+    # every snippet back through its reference and through the index
+    with tempfile.TemporaryDirectory() as directory:
+        pack_path = os.path.join(directory, 'check.pack')
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(_append_worker, [(pack_path, worker, batches, per_batch)
+                                                    for worker in range(processes)])
+        pack = SegmentPack(pack_path)
+        errors = 0
+        total = 0
+        for refs in results:
+            for text, ref in refs:
+                total += 1
+                _, offset, length = parse_ref(ref)
+                if pack.read(offset, length) != text:
+                    errors += 1
+        for worker in range(processes):
+            for batch in range(batches):
+                for i in range(per_batch):
+                    entry = pack.lookup(f"w{worker}_{batch}_{i}.html")
+                    if entry is None or f"worker {worker} batch {batch} item {i} " not in pack.read(*entry):
+                        errors += 1
+        pack.close()
+        return total, errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packed product snippet storage")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_cmd = commands.add_parser('migrate', help="append a data/products tree to a pack")
+    migrate_cmd.add_argument('products_dir', nargs='?', default=DEFAULT_PRODUCTS_DIR)
+    migrate_cmd.add_argument('--pack', default=DEFAULT_PACK)
+    migrate_cmd.add_argument('--delete', action='store_true', help="remove the files once they are verified")
+    check_cmd = commands.add_parser('check', help="append from several processes and read everything back")
+    check_cmd.add_argument('--processes', type=int, default=2)
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        total, errors = check_concurrent_appends(args.processes)
+        print(f"{total} snippets appended by {args.processes} processes, {errors} errors")
+        if errors:
+            raise SystemExit("Concurrent appends corrupted the pack")
+        raise SystemExit(0)
+
+    verified, added, mismatches = migrate(args.products_dir, args.pack)
+    print(f"{len(verified) + mismatches} snippets, {added} added to {args.pack}, {mismatches} mismatches")
+    if mismatches:
+        raise SystemExit("Pack does not match the source files")
+    if args.delete:
+        # Only the files checked above; anything written since stays
+        for path in verified:
+            os.remove(path)
+        print(f"Removed {len(verified)} files from {args.products_dir}")
@@ -0,0 +1,296 @@
+import re
+import tempfile
+import uuid
+from collections import namedtuple
+from lxml import etree
+
+from Product_Detector_Heuristics import SCANNER
+
+# Streaming product detection. The page is fed to lxml's pull parser in
+# chunks and every element is judged when it closes, using the same flag
+# propagation as find_minimal_product_containers. Minimal containers are
+# serialized and yielded as soon as they close. Results match
+# find_minimal_product_containers on a soup parsed with the lxml backend
+# (checked in Product_Detector_Parity.py).
+#
+# Finished subtrees do not stay in the tree. Once no open ancestor can become
+# a container any more (a card below it settled), they are dropped. Otherwise
+# an ancestor may still be emitted and needs their markup, so once the
+# finished children of an element hold SPOOL_MIN_NODES nodes they are
+# serialized to a temporary file and replaced by one placeholder comment,
+# which is expanded again if the ancestor is emitted. The tree in memory is
+# therefore bounded by the open elements and a few hundred nodes each, not by
+# the page; what grows with the page is its text, which the ancestors need
+# for the price and unit checks.
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MIN_NODES = 256
+
+# bs4 gives strings inside these tags their own string types, so they never
+# count towards the text of ordinary tags (see HTMLTreeBuilder).
+STRING_CONTAINER_TAGS = {'rt', 'rp', 'style', 'script', 'template'}
+
+# lxml never puts elements inside these, so they can never hold an image
+RAW_TEXT_TAGS = {'style', 'script'}
+
+# Outside these tags bs4 collapses whitespace-only strings to one character
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+StreamedProduct = namedtuple('StreamedProduct', ['html', 'text', 'images'])
+
+class _Frame:
+    __slots__ = ('element', 'container', 'preserve', 'parts', 'own_parts', 'consumed', 'seen', 'started',
+                 'has_image', 'price_hit', 'unit_hit', 'child_valid', 'keep', 'spooled', 'pending',
+                 'placeholders')
+
+    def __init__(self, element, container, preserve):
+        self.element = element
+        # Name of the innermost string container tag around this element
+        self.container = container
+        self.preserve = preserve
+        # Text pieces of the element; None once the text is no longer needed
+        self.parts = []
+        self.own_parts = None
+        if element.tag in STRING_CONTAINER_TAGS and element.tag not in RAW_TEXT_TAGS:
+            self.own_parts = []
+        # Children whose tails were read, and children the events reached.
+        # The parser runs ahead of the events, so the element may already
+        # hold more children than seen.
+        self.consumed = 0
+        self.seen = 0
+        self.started = False
+        self.has_image = False
+        self.price_hit = False
+        self.unit_hit = False
+        self.child_valid = False
+        # Whether this subtree must stay intact because it, or an ancestor,
+        # may still be emitted as a product container
+        self.keep = True
+        # Children before this index are spooled placeholders
+        self.spooled = 0
+        # Nodes in the finished children not spooled yet, and placeholders
+        self.pending = 0
+        self.placeholders = 0
+
+class StreamingDetector:
+
+    def __init__(self):
+        self.parser = etree.HTMLPullParser(events=('start', 'end', 'comment', 'pi'))
+        self.frames = []
+        # Spooled fragments: (offset, length, images) in a temporary file
+        self._spool = None
+        self._fragments = []
+        self._token = f"pd-spool-{uuid.uuid4().hex}"
+        self._placeholder = re.compile(f"<!--{self._token}:(\\d+)-->")
+        # Nodes held in the tree now and at most, for memory checks
+        self.live_nodes = 0
+        self.peak_nodes = 0
+
+    def feed(self, data):
+        self.parser.feed(data)
+        return self._process_events()
+
+    def close(self):
+        self.parser.close()
+        products = self._process_events()
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        return products
+
+    def _count(self, nodes):
+        self.live_nodes += nodes
+        if self.live_nodes > self.peak_nodes:
+            self.peak_nodes = self.live_nodes
+
+    def _process_events(self):
+        products = []
+        for event, element in self.parser.read_events():
+            if event == 'start':
+                self._start(element)
+            elif event in ('comment', 'pi'):
+                self._count(1)
+                if self.frames:
+                    self.frames[-1].seen += 1
+                    self.frames[-1].pending += 1
+            else:
+                product = self._end(element)
+                if product is not None:
+                    products.append(product)
+        return products
+
+    def _add_text(self, frame, text, container):
+        # Text directly inside frame's element, with the string container
+        # that bs4 would assign to it
+        if not text:
+            return
+        if not frame.preserve and not text.strip(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        if container is None:
+            if frame.parts is not None:
+                frame.parts.append(text)
+            return
+        for open_frame in self.frames:
+            if open_frame.own_parts is not None and open_frame.element.tag == container:
+                open_frame.own_parts.append(text)
+
+    def _flush(self, frame, upto):
+        # Consume the element's own text and the tails of its finished
+        # children. Tails are only complete once the next sibling starts or
+        # the parent ends, which is why this runs at those two points.
+        element = frame.element
+        if not frame.started:
+            frame.started = True
+            # Inline scripts can be megabytes of JSON that nothing reads
+            if frame.container not in RAW_TEXT_TAGS:
+                self._add_text(frame, element.text, frame.container)
+        children = element[frame.consumed:upto]
+        for child in children:
+            self._add_text(frame, child.tail, frame.container)
+        frame.consumed += len(children)
+        if not frame.keep and frame.consumed:
+            del element[:frame.consumed]
+            frame.seen -= frame.consumed
+            frame.consumed = 0
+            frame.spooled = 0
+            self._count(-(frame.pending + frame.placeholders))
+            frame.pending = 0
+            frame.placeholders = 0
+        elif frame.pending >= SPOOL_MIN_NODES and frame.consumed > frame.spooled:
+            self._spool_children(frame)
+
+    def _spool_children(self, frame):
+        # Replaces the consumed children after the last placeholder (with
+        # their tails, which were read already) by a single placeholder
+        element = frame.element
+        start, end = frame.spooled, frame.consumed
+        children = element[start:end]
+        html = "".join(etree.tostring(child, method='html', encoding='unicode', with_tail=True)
+                       for child in children)
+        images = [src for child in children for src in self._images(child)]
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile()
+        data = html.encode('utf-8')
+        offset = self._spool.seek(0, 2)
+        self._spool.write(data)
+        self._fragments.append((offset, len(data), images))
+        element[start:end] = [etree.Comment(f"{self._token}:{len(self._fragments) - 1}")]
+        removed = end - start - 1
+        frame.consumed -= removed
+        frame.seen -= removed
+        frame.spooled = frame.consumed
+        self._count(1 - frame.pending)
+        frame.pending = 0
+        frame.placeholders += 1
+
+    def _fragment(self, index):
+        offset, length, _ = self._fragments[index]
+        self._spool.seek(offset)
+        return self._spool.read(length).decode('utf-8')
+
+    def _expand(self, html):
+        # Puts the spooled markup back in place of the placeholders, which
+        # may themselves contain placeholders
+        while self._fragments and self._token in html:
+            html = self._placeholder.sub(lambda match: self._fragment(int(match.group(1))), html)
+        return html
+
+    def _images(self, element):
+        # img sources in document order, including spooled parts
+        images = []
+        for node in element.iter():
+            if node.tag == 'img':
+                images.append(node.get('src'))
+            elif node.tag is etree.Comment and node.text and node.text.startswith(self._token + ':'):
+                images.extend(self._fragments[int(node.text.rsplit(':', 1)[1])][2])
+        return images
+
+    def _start(self, element):
+        self._count(1)
+        container = None
+        preserve = False
+        if self.frames:
+            parent = self.frames[-1]
+            self._flush(parent, parent.seen)
+            parent.seen += 1
+            container = parent.container
+            preserve = parent.preserve
+        if element.tag in STRING_CONTAINER_TAGS:
+            container = element.tag
+        if element.tag in PRESERVE_WHITESPACE_TAGS:
+            preserve = True
+        self.frames.append(_Frame(element, container, preserve))
+
+    def _end(self, element):
+        frame = self.frames[-1]
+        self._flush(frame, frame.seen)
+        self.frames.pop()
+
+        text = "".join(frame.parts) if frame.parts is not None else None
+        valid = False
+        settled = False
+        if frame.has_image:
+            if frame.own_parts is None:
+                if frame.price_hit and frame.unit_hit:
+                    valid = True
+                else:
+                    scan = SCANNER.scan(text.lower(), want_inner_unit=True)
+                    frame.price_hit = scan.price is not None and not scan.word_price
+                    frame.unit_hit = scan.inner_unit
+                    valid = scan.price is not None and scan.unit is not None
+                settled = frame.price_hit and frame.unit_hit
+            else:
+                scan = SCANNER.scan("".join(frame.own_parts).lower())
+                valid = scan.price is not None and scan.unit is not None
+
+        product = None
+        if valid and not frame.child_valid:
+            images = self._images(element)
+            html = self._expand(etree.tostring(element, method='html', encoding='unicode', with_tail=False))
+            product = StreamedProduct(html, text, images)
+
+        if settled:
+            # Every open ancestor inherits these flags, so all of them are
+            # valid with a valid child and none can be a minimal container.
+            # Hand the flags up right away and stop collecting their text.
+            for open_frame in self.frames:
+                open_frame.keep = False
+                open_frame.has_image = True
+                open_frame.price_hit = True
+                open_frame.unit_hit = True
+                open_frame.parts = None
+
+        if self.frames:
+            parent = self.frames[-1]
+            parent.pending += 1 + frame.pending + frame.placeholders
+            if parent.parts is not None:
+                parent.parts.append(text)
+            if frame.has_image or element.tag == 'img':
+                parent.has_image = True
+            if frame.price_hit:
+                parent.price_hit = True
+            if frame.unit_hit:
+                parent.unit_hit = True
+            if valid:
+                parent.child_valid = True
+        return product
+
+def stream_product_containers(chunks):
+    # Yields StreamedProduct records from an iterable of HTML text chunks
+    detector = StreamingDetector()
+    for chunk in chunks:
+        yield from detector.feed(chunk)
+    yield from detector.close()
+
+def iter_string_chunks(html, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(html), chunk_size):
+        yield html[start:start + chunk_size]
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
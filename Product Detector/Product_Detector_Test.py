@@ -1,81 +1,28 @@
 ﻿import os
 import joblib
-import time
-import re
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
+
+from Product_Detector_Browser import fetch_rendered_page, get_browser_pool
+from Product_Detector_Heuristics import find_minimal_product_containers
+from Product_Detector_Parser import make_soup
+from Product_Detector_Readiness import readiness_for
 
 # Load the saved model
 loaded_model = joblib.load('random_forest_product_model.pkl')
 print("Loaded the saved model.")
 
-# Helper functions (contains_price, contains_unit, contains_image, is_valid_product, find_minimal_product_containers)
-
-def contains_price(text):
-    text = text.strip()
-    price_pattern = r"""
-        (?:  
-            (?:€|\$|₺|£|¥|TL)\s?[\d]+(?:[.,]\d+)?  
-            |  
-            [\d]+(?:[.,]\d+)?\s?(?:€|\$|₺|£|¥|TL)  
-            |  
-            [\d]+(?:[.,]\d+)(?:\s?[^\w\s])?  
-        )
-    """
-    if re.search(price_pattern, text, re.VERBOSE | re.IGNORECASE):
-        return True
-    words = text.split()
-    for i, word in enumerate(words):
-        if word.replace(",", "").replace(".", "").isdigit():
-            if i + 1 < len(words) and words[i + 1] in ['€', '$', '₺', '£', '¥', 'TL']:
-                return True
-    return False
-
-def contains_unit(text):
-    return bool(re.search(r"\b\d+(\.\d+)?\s?(g|kg|ml|l|pcs|unit|x)?\b", text, re.IGNORECASE))
-
-def contains_image(element):
-    return element.find("img") is not None
-
-def is_valid_product(element):
-    text_content = element.get_text().lower()
-    has_price = contains_price(text_content)
-    has_unit = contains_unit(text_content)
-    has_image = contains_image(element)
-    return has_price and has_unit and has_image
-
-def find_minimal_product_containers(soup):
-    product_candidates = [el for el in soup.find_all(True) if is_valid_product(el)]
-    minimal_products = []
-    for candidate in product_candidates:
-        if not any(is_valid_product(child) for child in candidate.find_all(True, recursive=False)):
-            minimal_products.append(candidate)
-    return minimal_products
-
-# Selenium setup to load the URL
+# Load the URL in a pooled headless browser
 def visit_page(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Optional: Run in headless mode
-    service = Service("chromedriver.exe")
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    
-    driver.get(url)
-    time.sleep(5)  # Allow time for the page to load
-    
-    html = driver.page_source
-    driver.quit()
-    
+    pool = get_browser_pool(headless=True)
+    html, _ = fetch_rendered_page(url, pool, readiness_for(url, scroll=False))  # Wait for the page to settle
     return html
 
 # Function to process each URL
 def process_url(url):
     html = visit_page(url)
     
-    # Parse HTML using BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
+    # Parse HTML with the configured parser backend
+    soup = make_soup(html)
     
     # Find minimal product containers
     products = find_minimal_product_containers(soup)
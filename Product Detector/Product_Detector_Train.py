@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import pandas as pd
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import accuracy_score, classification_report, precision_recall_fscore_support
+from sklearn.model_selection import train_test_split
+
+from Product_Detector_DB import get_database
+from Product_Detector_Features import FEATURE_WORKERS, get_feature_cache
+from Product_Detector_Models import ARTIFACTS, MODEL_NAMES
+
+# Trains any subset of the classifiers on one shared feature matrix: the
+# training rows are read and parsed once, the TF-IDF vectorizer is fitted
+# once, and the models are fitted side by side in worker processes.
+#
+#   python Product_Detector_Train.py                    # all four models
+#   python Product_Detector_Train.py xgboost linear_svc
+#
+# All models in the output directory must use the same vectorizer, so a run
+# that trains only some of them reuses the tfidf_vectorizer.pkl already there
+# (--refit-vectorizer is refused while models that are not retrained sit
+# next to it). The vectorizer and models are written to temporary files and
+# moved into place one by one once all of them are saved, so a run killed
+# during that step can leave models next to a vectorizer they were not
+# trained with. training_report.json records the vectorizer digest and the
+# timings and test metrics of each model, and the next run compares it with
+# the vectorizer on disk (see check_previous_run).
+
+REPORT_FILE = 'training_report.json'
+MAX_FEATURES = 1000
+
+def make_classifier(name):
+    if name == 'random_forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(n_estimators=100, random_state=42)
+    if name == 'adaboost':
+        from sklearn.ensemble import AdaBoostClassifier
+        return AdaBoostClassifier(n_estimators=100, random_state=42)
+    if name == 'linear_svc':
+        from sklearn.svm import LinearSVC
+        return LinearSVC(random_state=42, max_iter=1000)
+    if name == 'xgboost':
+        from xgboost import XGBClassifier
+        return XGBClassifier(n_estimators=100, eval_metric='logloss', random_state=42)
+    raise ValueError(f"Unknown model: {name}")
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def check_previous_run(output_dir, vectorizer_path):
+    # Removes .tmp files an interrupted run left behind and returns True when
+    # the vectorizer on disk is not the one the last report was written for
+    for name in list(ARTIFACTS.values()) + [REPORT_FILE]:
+        path = os.path.join(output_dir, name) + '.tmp'
+        if os.path.exists(path):
+            print(f"Removing {path} left by an interrupted run")
+            os.remove(path)
+    report_path = os.path.join(output_dir, REPORT_FILE)
+    if not (os.path.exists(report_path) and os.path.exists(vectorizer_path)):
+        return False
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('vectorizer_sha1') != file_digest(vectorizer_path)
+
+def build_features(vectorizer, page_texts, product_texts):
+    # One row per product: [page vector | product vector]. Products of the
+    # same page share its text, so each distinct page is vectorized once
+    positions = {}
+    rows = [positions.setdefault(text, len(positions)) for text in page_texts]
+    X_page = vectorizer.transform(list(positions))[rows]
+    return sp.hstack([X_page, vectorizer.transform(product_texts)], format='csr')
+
+def fit_model(name, X_train, y_train, X_test, y_test):
+    # Runs in a worker process, returns the fitted model and its report
+    model = make_classifier(name)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_s = time.perf_counter() - start
+
+    precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average='binary', zero_division=0)
+    report = {
+        'model': name,
+        'fit_s': fit_s,
+        'predict_s': predict_s,
+        'accuracy': accuracy_score(y_test, y_pred),
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'classification_report': classification_report(y_test, y_pred, zero_division=0),
+    }
+    return model, report
+
+def train(models=MODEL_NAMES, output_dir='.', test_size=0.2, jobs=None, refit_vectorizer=False,
+          feature_workers=FEATURE_WORKERS):
+    vectorizer_path = os.path.join(output_dir, ARTIFACTS['vectorizer'])
+    others = [name for name in MODEL_NAMES
+              if name not in models and os.path.exists(os.path.join(output_dir, ARTIFACTS[name]))]
+    if refit_vectorizer and others and os.path.exists(vectorizer_path):
+        # A new vectorizer would silently break the models left untouched
+        raise SystemExit(f"--refit-vectorizer would leave {', '.join(others)} on the old vectorizer, "
+                         f"train them too or use another --output")
+    if check_previous_run(output_dir, vectorizer_path) and set(models) != set(MODEL_NAMES):
+        # Some models may have been replaced and others not, so none of them can be reused
+        raise SystemExit(f"{vectorizer_path} does not match {REPORT_FILE}, an earlier run was interrupted; "
+                         f"retrain all models")
+    timings = {}
+    start = time.perf_counter()
+    df = pd.DataFrame(get_database().fetch_train_data())
+    if df.empty:
+        raise SystemExit("train_data is empty, label some pages first")
+    timings['fetch_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cache = get_feature_cache()
+    df['page_text'], df['product_text'] = zip(*cache.extract_rows(df.to_dict('records'), feature_workers))
+    timings['extract_s'] = time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    reuse = (not refit_vectorizer and set(models) != set(MODEL_NAMES) and os.path.exists(vectorizer_path))
+    start = time.perf_counter()
+    if reuse:
+        print(f"Reusing {vectorizer_path} so the other models stay consistent (--refit-vectorizer to refit)")
+        vectorizer = joblib.load(vectorizer_path)
+    else:
+        vectorizer = TfidfVectorizer(max_features=MAX_FEATURES)
+        vectorizer.fit(df['page_text'])
+    X = build_features(vectorizer, df['page_text'], df['product_text'])
+    timings['vectorize_s'] = time.perf_counter() - start
+
+    # One split for every model, so their metrics compare
+    X_train, X_test, y_train, y_test = train_test_split(X, df['label'].astype(int).values,
+                                                        test_size=test_size, random_state=42)
+    start = time.perf_counter()
+    results = Parallel(n_jobs=jobs or min(len(models), os.cpu_count() or 1))(
+        delayed(fit_model)(name, X_train, y_train, X_test, y_test) for name in models)
+    timings['train_s'] = time.perf_counter() - start
+
+    # Everything is dumped to .tmp files first, so a failed dump leaves the
+    # old vectorizer and models in place, all still matching. The report is
+    # written last; until then check_previous_run sees a mismatch
+    written = []
+    if not reuse:
+        joblib.dump(vectorizer, vectorizer_path + '.tmp')
+        written.append(vectorizer_path)
+    vectorizer_sha1 = file_digest(vectorizer_path + '.tmp' if not reuse else vectorizer_path)
+    reports = []
+    for name, (model, report) in zip(models, results):
+        path = os.path.join(output_dir, ARTIFACTS[name])
+        joblib.dump(model, path + '.tmp')
+        written.append(path)
+        report.update(path=path, vectorizer_sha1=vectorizer_sha1)
+        reports.append(report)
+    for path in written:
+        os.replace(path + '.tmp', path)
+
+    # Keep the reports of models trained earlier on this same vectorizer
+    report_path = os.path.join(output_dir, REPORT_FILE)
+    if os.path.exists(report_path):
+        with open(report_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f).get('models', [])
+        for report in previous:
+            if report['model'] in models:
+                continue
+            if report.get('vectorizer_sha1') == vectorizer_sha1:
+                reports.append(report)
+            else:
+                print(f"Warning: {report['path']} was trained with another vectorizer, retrain it")
+    reports.sort(key=lambda report: MODEL_NAMES.index(report['model']))
+
+    summary = {
+        'created_at': time.time(),
+        'rows': len(df),
+        'train_rows': X_train.shape[0],
+        'test_rows': X_test.shape[0],
+        'features': X.shape[1],
+        'vectorizer': vectorizer_path,
+        'vectorizer_sha1': vectorizer_sha1,
+        'vectorizer_refitted': not reuse,
+        'feature_cache': cache.summary(),
+        'timings': timings,
+        'models': reports,
+    }
+    with open(report_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(report_path + '.tmp', report_path)
+    return summary
+
+def print_summary(summary):
+    timings = summary['timings']
+    print(f"{summary['rows']} rows ({summary['train_rows']} train, {summary['test_rows']} test), "
+          f"{summary['features']} features")
+    print(f"fetch {timings['fetch_s']:.2f}s, extract {timings['extract_s']:.2f}s, "
+          f"vectorize {timings['vectorize_s']:.2f}s, train {timings['train_s']:.2f}s")
+    print(f"{'model':<15} {'fit s':>8} {'predict s':>10} {'accuracy':>9} {'precision':>10} {'recall':>8} {'f1':>6}")
+    for report in summary['models']:
+        print(f"{report['model']:<15} {report['fit_s']:>8.2f} {report['predict_s']:>10.3f} "
+              f"{report['accuracy']:>9.3f} {report['precision']:>10.3f} {report['recall']:>8.3f} "
+              f"{report['f1']:>6.3f}")
+    print(f"Vectorizer {summary['vectorizer']} ({summary['vectorizer_sha1'][:12]})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the product classifiers on shared features")
+    parser.add_argument('models', nargs='*', help=f"models to train ({', '.join(MODEL_NAMES)}), default all")
+    parser.add_argument('--output', default='.', help="directory for the vectorizer, models and report")
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--jobs', type=int, help="models trained at once, default one per model up to the cores")
+    parser.add_argument('--feature-workers', type=int, default=FEATURE_WORKERS,
+                        help="processes parsing the pages")
+    parser.add_argument('--refit-vectorizer', action='store_true',
+                        help="fit a new vectorizer even when only some models are trained "
+                             "(refused while other models in --output would keep the old one)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.models if name not in MODEL_NAMES]
+    if unknown:
+        parser.error(f"unknown models: {', '.join(unknown)}")
+
+    models = [name for name in MODEL_NAMES if name in args.models] or MODEL_NAMES
+    summary = train(models, args.output, args.test_size, args.jobs,
+                    args.refit_vectorizer, args.feature_workers)
+    print_summary(summary)
+    for report in summary['models']:
+        if report['model'] not in models:
+            continue
+        print(f"\n{report['model']} saved as {report['path']}\n{report['classification_report']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,26 @@
 import os
+import sys
 import uuid
-import requests
-from bs4 import BeautifulSoup
-import joblib
-import numpy as np
-import scipy.sparse as sp
-
-# Load vectorizer and models
-vectorizer = joblib.load('tfidf_vectorizer.pkl')
+
+from Product_Detector_Fetcher import get_http_session
+from Product_Detector_Models import get_registry, print_stats
+from Product_Detector_Parser import make_soup
+from Product_Detector_Predict import predict_page
+
+# Models are loaded on first use; pass model names to only use some of them,
+# e.g. python TestOutBound.py random_forest
+registry = get_registry()
 models = {
-    'Random Forest': joblib.load('random_forest_product_model.pkl'),
-    'AdaBoost': joblib.load('adaboost_product_model.pkl'),
-    'Linear SVC': joblib.load('linear_svc_product_model.pkl'),
-    'XGBoost': joblib.load('xgboost_product_model.pkl'),
+    'Random Forest': 'random_forest',
+    'AdaBoost': 'adaboost',
+    'Linear SVC': 'linear_svc',
+    'XGBoost': 'xgboost',
 }
+if sys.argv[1:]:
+    models = {label: name for label, name in models.items() if name in sys.argv[1:]}
 
 def get_html_from_url(url):
-    response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
+    response = get_http_session().get(url, timeout=15)
     return response.text if response.status_code == 200 else ''
 
 def get_all_segments(soup):
@@ -38,20 +42,18 @@ def get_all_segments(soup):
 def classify_segments(segments, full_page_text):
     results = {name: [] for name in models}
 
+    vectorizer = registry.get('vectorizer')
+
     # Transform the full page text once
     X_page = vectorizer.transform([full_page_text])
-    X_page_repeated = sp.vstack([X_page] * len(segments))
 
     # Transform each tag text
     tag_texts = [text for _, text in segments]
     X_product = vectorizer.transform(tag_texts)
 
-    # Combine like in training
-    X_combined = sp.hstack([X_page_repeated, X_product])
-
-    # Predict for each model
-    for model_name, model in models.items():
-        preds = model.predict(X_combined)
+    # Predict for each model, the page vector is not repeated per segment
+    for model_name, name in models.items():
+        preds, _ = predict_page(registry.get(name), X_page, X_product)
         results[model_name] = [html for (html, _), label in zip(segments, preds) if label == 1]
 
     return results
@@ -126,11 +128,12 @@ def save_page_html(content, output_dir='data/test'):
 if __name__ == "__main__":
     url = input("Enter URL: ").strip()
     html = get_html_from_url(url)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = make_soup(html)
     save_page_html(html)
     segments = get_all_segments(soup)
     full_page_text = soup.get_text(" ", strip=True)
     results = classify_segments(segments, full_page_text)
     save_results(results)
     print("Results saved to model_results.html")
+    print_stats(registry.stats())
 
@@ -1,62 +1,24 @@
 ﻿import os
+import sys
 import uuid
 import requests
-from bs4 import BeautifulSoup
-import joblib
-import numpy as np
-import scipy.sparse as sp
-import re  # Added import
 
-# Load vectorizer and models
-vectorizer = joblib.load('tfidf_vectorizer.pkl')
+from Product_Detector_Heuristics import find_minimal_product_containers
+from Product_Detector_Models import get_registry, print_stats
+from Product_Detector_Parser import make_soup
+from Product_Detector_Predict import predict_page
+
+# Models are loaded on first use; pass model names to only use some of them,
+# e.g. python TestOutBound_2.py random_forest
+registry = get_registry()
 models = {
-    'Random Forest': joblib.load('random_forest_product_model.pkl'),
-    'AdaBoost': joblib.load('adaboost_product_model.pkl'),
-    'Linear SVC': joblib.load('linear_svc_product_model.pkl'),
-    'XGBoost': joblib.load('xgboost_product_model.pkl'),
+    'Random Forest': 'random_forest',
+    'AdaBoost': 'adaboost',
+    'Linear SVC': 'linear_svc',
+    'XGBoost': 'xgboost',
 }
-
-# Added helper functions for product validation
-def contains_price(text):
-    text = text.strip()
-    price_pattern = r"""
-        (?:  
-            (?:€|\$|₺|£|¥|TL)\s?[\d]+(?:[.,]\d+)?  
-            |  
-            [\d]+(?:[.,]\d+)?\s?(?:€|\$|₺|£|¥|TL)  
-            |  
-            [\d]+(?:[.,]\d+)(?:\s?[^\w\s])?  
-        )
-    """
-    if re.search(price_pattern, text, re.VERBOSE | re.IGNORECASE):
-        return True
-    words = text.split()
-    for i, word in enumerate(words):
-        if word.replace(",", "").replace(".", "").isdigit():
-            if i + 1 < len(words) and words[i + 1] in ['€', '$', '₺', '£', '¥', 'TL']:
-                return True
-    return False
-
-def contains_unit(text):
-    return bool(re.search(r"\b\d+(\.\d+)?\s?(g|kg|ml|l|pcs|unit|x)?\b", text, re.IGNORECASE))
-
-def contains_image(element):
-    return element.find("img") is not None
-
-def is_valid_product(element):
-    text_content = element.get_text().lower()
-    has_price = contains_price(text_content)
-    has_unit = contains_unit(text_content)
-    has_image = contains_image(element)
-    return has_price and has_unit and has_image
-
-def find_minimal_product_containers(soup):
-    product_candidates = [el for el in soup.find_all(True) if is_valid_product(el)]
-    minimal_products = []
-    for candidate in product_candidates:
-        if not any(is_valid_product(child) for child in candidate.find_all(True, recursive=False)):
-            minimal_products.append(candidate)
-    return minimal_products
+if sys.argv[1:]:
+    models = {label: name for label, name in models.items() if name in sys.argv[1:]}
 
 def get_html_from_url(url):
     response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
@@ -65,20 +27,18 @@ def get_html_from_url(url):
 def classify_segments(segments, full_page_text):
     results = {name: [] for name in models}
 
+    vectorizer = registry.get('vectorizer')
+
     # Transform the full page text once
     X_page = vectorizer.transform([full_page_text])
-    X_page_repeated = sp.vstack([X_page] * len(segments))
 
     # Transform each tag text
     tag_texts = [text for _, text in segments]
     X_product = vectorizer.transform(tag_texts)
 
-    # Combine like in training
-    X_combined = sp.hstack([X_page_repeated, X_product])
-
-    # Predict for each model
-    for model_name, model in models.items():
-        preds = model.predict(X_combined)
+    # Predict for each model, the page vector is not repeated per segment
+    for model_name, name in models.items():
+        preds, _ = predict_page(registry.get(name), X_page, X_product)
         results[model_name] = [html for (html, _), label in zip(segments, preds) if label == 1]
 
     return results
@@ -153,7 +113,7 @@ def save_page_html(content, output_dir='data/test2'):
 if __name__ == "__main__":
     url = input("Enter URL: ").strip()
     html = get_html_from_url(url)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = make_soup(html)
     # save_page_html(html)
     
     # Replace segment collection with product validation logic
@@ -163,4 +123,5 @@ if __name__ == "__main__":
     full_page_text = soup.get_text(" ", strip=True)
     results = classify_segments(segments, full_page_text)
     save_results(results)
-    print("Results saved to model_results.html")
\ No newline at end of file
+    print("Results saved to model_results.html")
+    print_stats(registry.stats())
\ No newline at end of file